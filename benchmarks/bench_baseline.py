@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+""" Local median vs. mean baselines of the dip search.
+
+Times the local baselines of `windowedMedian`, `windowedMean` and its
+sigma-clipped variant on a long synthetic light curve, together with the
+dip searches that use them, and reports how well the dips found with the
+'mean' and 'clipped-mean' baselines agree with those of the 'median'
+baseline for the light curves in lcps/tests/. Run from the repository root:
+
+    $ python benchmarks/bench_baseline.py [Ndata]
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+LCPS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lcps')
+sys.path.insert(0, LCPS_DIR)
+import slidingWindow
+from lcps_io import open_lightcurve
+
+BASELINES = ('median', 'mean', 'clipped-mean')
+
+
+def synthetic_lightcurve(Ndata, Ndips=50, seed=0):
+    """ Long-cadence-like light curve with box-shaped dips."""
+    rs = np.random.RandomState(seed)
+    t = 2000. + 0.0204*np.arange(Ndata)
+    flux = rs.normal(1., 0.001, Ndata).astype(np.float32)
+    for i in rs.randint(0, Ndata - 20, Ndips):
+        flux[i:i + rs.randint(2, 15)] *= rs.uniform(0.97, 0.995)
+    return t, flux
+
+
+def matched(t_egress, reference, tolerance):
+    """ Mask of the egress times with a reference egress within
+    `tolerance`."""
+    reference = np.concatenate([[-np.inf], reference, [np.inf]])
+    i = np.searchsorted(reference, t_egress)
+    distance = np.minimum(abs(reference[i - 1] - t_egress),
+        abs(reference[i] - t_egress))
+    return distance <= tolerance
+
+
+def bench_throughput(Ndata):
+    t, flux = synthetic_lightcurve(Ndata)
+    profiles = (('median', slidingWindow.windowedMedian),
+        ('mean', slidingWindow.windowedMean),
+        ('clipped-mean', slidingWindow._clippedMean))
+    print('{} data points, winSize=50, stepSize=10, Nneighb=1'.format(Ndata))
+    print('  {:>12s} {:>12s} {:>14s}'.format('baseline', 'profile [s]',
+        'dipsearch [s]'))
+    for baseline, profile in profiles:
+        t0 = time.time()
+        profile(flux, 50, 10, 1)
+        tProfile = time.time() - t0
+        t0 = time.time()
+        slidingWindow.dipsearch_arrays(t, flux, 50, 10, 1, 2, 49, 0.98,
+            method='vectorized', baseline=baseline)
+        tSearch = time.time() - t0
+        print('  {:>12s} {:12.3f} {:14.3f}'.format(baseline, tProfile,
+            tSearch))
+
+
+def bench_agreement(path):
+    configurations = (dict(winSize=50, stepSize=10, Nneighb=1, minDur=2,
+        maxDur=49, detectionThresh=0.98), dict(winSize=10, stepSize=1,
+        Nneighb=1, minDur=2, maxDur=5, detectionThresh=0.995))
+    print('agreement with the median baseline for the light curves in '
+        '{}'.format(path))
+    print('  {:>8s} {:>10s} {:>12s} {:>5s} {:>7s} {:>11s} {:>13s}'.format(
+        'winSize', 'EPIC', 'baseline', 'dips', 'common', 'median only',
+        'baseline only'))
+    for file in sorted(os.listdir(path)):
+        EPICno, photometry = open_lightcurve(os.path.join(path, file))
+        t = np.asarray(photometry['TIME'])
+        flux = np.asarray(photometry['FLUX'])
+        for params in configurations:
+            tolerance = params['maxDur']*(t[-1] - t[0])/len(t)
+            reference = slidingWindow.dipsearch_arrays(t, flux,
+                method='vectorized', **params)[0]
+            for baseline in BASELINES:
+                t_egress = slidingWindow.dipsearch_arrays(t, flux,
+                    method='vectorized', baseline=baseline, **params)[0]
+                common = matched(t_egress, reference, tolerance).sum()
+                missed = (~matched(reference, t_egress, tolerance)).sum()
+                print('  {:8d} {:>10} {:>12s} {:5d} {:7d} {:11d} {:13d}'.format(
+                    params['winSize'], EPICno, baseline, len(t_egress),
+                    common, missed, len(t_egress) - common))
+
+
+if __name__ == "__main__":
+    bench_throughput(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
+    bench_agreement(os.path.join(LCPS_DIR, 'tests'))
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+""" Out-of-core dip search with `slidingWindow.dipsearch_chunked`.
+
+Writes a long synthetic light curve to .npy files, searches it once in
+memory with `dipsearch_arrays` and once through memory maps with
+`dipsearch_chunked` for several chunk lengths, and checks that all searches
+give the same dips. Run from the repository root:
+
+    $ python benchmarks/bench_chunked.py [Ndata]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+
+LCPS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lcps')
+sys.path.insert(0, LCPS_DIR)
+import slidingWindow
+
+
+def synthetic_lightcurve(Ndata, seed=0):
+    """ Short-cadence-like light curve with box-shaped dips."""
+    rs = np.random.RandomState(seed)
+    t = 2000. + np.arange(Ndata)/1440.
+    flux = rs.normal(1., 0.001, Ndata).astype(np.float32)
+    for i in rs.randint(0, Ndata - 20, Ndata//10000):
+        flux[i:i + rs.randint(2, 15)] *= rs.uniform(0.97, 0.995)
+    return t, flux
+
+
+def bench_chunked(Ndata):
+    params = dict(winSize=50, stepSize=10, Nneighb=1, minDur=2, maxDur=49,
+        detectionThresh=0.98)
+    directory = tempfile.mkdtemp()
+    try:
+        t, flux = synthetic_lightcurve(Ndata)
+        np.save(os.path.join(directory, 'time.npy'), t)
+        np.save(os.path.join(directory, 'flux.npy'), flux)
+        del t, flux
+
+        t0 = time.time()
+        t = np.load(os.path.join(directory, 'time.npy'))
+        flux = np.load(os.path.join(directory, 'flux.npy'))
+        reference = slidingWindow.dipsearch_arrays(t, flux,
+            method='vectorized', **params)
+        tMemory = time.time() - t0
+        del t, flux
+
+        print('{} data points, winSize=50, stepSize=10, Nneighb=1'.format(
+            Ndata))
+        print('  {:>12s} {:>14s} {:>10s} {:>6s} {:>10s}'.format('chunkLength',
+            'points/chunk', 'time [s]', 'dips', 'identical'))
+        print('  {:>12s} {:14d} {:10.3f} {:6d} {:>10s}'.format('in memory',
+            Ndata, tMemory, len(reference[0]), '-'))
+        for chunkLength in (2**16, 2**20, 2**22):
+            t0 = time.time()
+            t = np.load(os.path.join(directory, 'time.npy'), mmap_mode='r')
+            flux = np.load(os.path.join(directory, 'flux.npy'), mmap_mode='r')
+            dips = slidingWindow.dipsearch_chunked(t, flux,
+                chunkLength=chunkLength, **params)
+            tChunked = time.time() - t0
+            del t, flux
+            identical = all(np.array_equal(a, b) for a, b in zip(dips,
+                reference))
+            print('  {:12d} {:14d} {:10.3f} {:6d} {:>10s}'.format(chunkLength,
+                min(Ndata, chunkLength + 3*params['winSize']), tChunked,
+                len(dips[0]), str(identical)))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    bench_chunked(int(sys.argv[1]) if len(sys.argv) > 1 else 10000000)
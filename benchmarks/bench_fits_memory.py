@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+""" Peak memory of the FITS light curve readers in `lcps_io`.
+
+Writes a synthetic light curve file with the 20 columns of the Kepler/K2
+LIGHTCURVE extension and measures the peak resident set size of opening it
+with the previous `open_fits`, the current `open_fits` and `read_fits`. Every
+reader runs in a fresh process. Run from the repository root:
+
+    $ python benchmarks/bench_fits_memory.py [Nrows]
+"""
+
+import os
+import sys
+import shutil
+import resource
+import tempfile
+import subprocess
+import numpy as np
+from astropy.io import fits
+from astropy.table import Table
+
+LCPS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lcps')
+sys.path.insert(0, LCPS_DIR)
+import lcps_io
+
+COLUMNS = [('TIME', 'D'), ('TIMECORR', 'E'), ('CADENCENO', 'J'),
+    ('SAP_FLUX', 'E'), ('SAP_FLUX_ERR', 'E'), ('SAP_BKG', 'E'),
+    ('SAP_BKG_ERR', 'E'), ('PDCSAP_FLUX', 'E'), ('PDCSAP_FLUX_ERR', 'E'),
+    ('SAP_QUALITY', 'J'), ('PSF_CENTR1', 'D'), ('PSF_CENTR1_ERR', 'E'),
+    ('PSF_CENTR2', 'D'), ('PSF_CENTR2_ERR', 'E'), ('MOM_CENTR1', 'D'),
+    ('MOM_CENTR1_ERR', 'E'), ('MOM_CENTR2', 'D'), ('MOM_CENTR2_ERR', 'E'),
+    ('POS_CORR1', 'E'), ('POS_CORR2', 'E')]
+
+
+def open_fits_table(filename):
+    """ FITS reader used before lcps 0.4."""
+    hdulist = fits.open(filename)
+    EPICno = hdulist[1].header['KEPLERID']
+    tbdata = hdulist[1].data
+    hdulist.close()
+    photometry = Table([tbdata['TIME'], tbdata['PDCSAP_FLUX'],
+        tbdata['PDCSAP_FLUX_ERR']], names = ('TIME', 'FLUX','FLUX_ERR'))
+    photometry = photometry[~np.isnan(photometry['FLUX'])]
+    return EPICno, photometry
+
+
+LOADERS = {
+    'previous open_fits': open_fits_table,
+    'open_fits': lcps_io.open_fits,
+    'read_fits (float64)': lcps_io.read_fits,
+    'read_fits (float32)': lambda f: lcps_io.read_fits(f, dtype=np.float32),
+}
+
+
+def write_lightcurve(filename, Nrows):
+    """ Write a synthetic Kepler light curve file with `Nrows` cadences."""
+    rs = np.random.RandomState(0)
+    columns = []
+    for name, format in COLUMNS:
+        if format == 'J':
+            array = np.arange(Nrows, dtype=np.int32)
+        else:
+            array = rs.normal(1.0, 0.001, Nrows)
+        if name == 'PDCSAP_FLUX':
+            array[::50] = np.nan
+        columns.append(fits.Column(name=name, format=format, array=array))
+    hdu = fits.BinTableHDU.from_columns(columns)
+    hdu.header['KEPLERID'] = 9999999
+    hdu.writeto(filename)
+
+
+def _procStatus(key):
+    """ Memory entry of /proc/self/status in MB."""
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(key + ':'):
+                return int(line.split()[1])/1024.
+
+
+def measure(loader, filename):
+    """ Print the increase of the peak RSS caused by a reader."""
+    try:
+        # reset the peak RSS ("high water mark") of this process (Linux only)
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        before = _procStatus('VmRSS')
+        result = LOADERS[loader](filename)
+        print(_procStatus('VmHWM') - before)
+    except IOError:
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.
+        result = LOADERS[loader](filename)
+        print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024. - before)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--measure':
+        measure(sys.argv[2], sys.argv[3])
+        sys.exit()
+
+    Nrows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'ktwo999999999-c00_llc.fits')
+        write_lightcurve(filename, Nrows)
+        print('{} cadences, file size {:.1f} MB'.format(Nrows,
+            os.path.getsize(filename)/1024.**2))
+        for loader in sorted(LOADERS):
+            increase = subprocess.check_output([sys.executable,
+                os.path.abspath(__file__), '--measure', loader, filename])
+            print('  {:22s} peak RSS +{:7.1f} MB'.format(loader,
+                float(increase)))
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+""" Micro-benchmarks of the light curve readers in `lcps_io`.
+
+Compares `open_k2sff` with the previous line-by-line parser on the bundled
+K2SFF light curve. Run from the repository root:
+
+    $ python benchmarks/bench_io.py
+"""
+
+import os
+import sys
+import timeit
+import tempfile
+import numpy as np
+from astropy.table import Table
+
+LCPS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lcps')
+sys.path.insert(0, LCPS_DIR)
+from lcps_io import open_k2sff
+
+K2SFF_FILE = os.path.join(LCPS_DIR, 'tests', '220132548')
+
+
+def open_k2sff_readlines(filename):
+    """ Line-by-line K2SFF parser used before lcps 0.4."""
+    with open(filename, 'r') as infile:
+        lines = infile.readlines()
+        phot = np.zeros([len(lines) - 1, 2])
+        for i, line in enumerate(lines[1:]):
+            line = line.rstrip(',\n')
+            line = line.split(',')
+            phot[i][:] = line
+        photometry = Table(phot, names = ('TIME', 'FLUX'))
+    photometry = photometry[~np.isnan(photometry['FLUX'])]
+    return filename.split('/')[-1], photometry
+
+
+def bench_k2sff(number=200):
+    """ Time both K2SFF parsers and check that their results agree."""
+    _, new = open_k2sff(K2SFF_FILE)
+    _, old = open_k2sff_readlines(K2SFF_FILE)
+    for name in ('TIME', 'FLUX'):
+        assert np.array_equal(new[name], old[name])
+
+    # both parsers tolerate any number of trailing commas
+    with open(K2SFF_FILE, 'r') as f:
+        lines = f.read().split('\n')
+    commas = tempfile.NamedTemporaryFile('w', delete=False)
+    with commas:
+        commas.write('\n'.join([lines[0]] + [line.rstrip(',') + ','*(i % 3)
+            for i, line in enumerate(lines[1:-1])]) + '\n')
+    try:
+        _, new = open_k2sff(commas.name)
+        _, old = open_k2sff_readlines(commas.name)
+    finally:
+        os.remove(commas.name)
+    for name in ('TIME', 'FLUX'):
+        assert np.array_equal(new[name], old[name])
+
+    tOld = min(timeit.repeat(lambda: open_k2sff_readlines(K2SFF_FILE),
+        number=number, repeat=3))/number
+    tNew = min(timeit.repeat(lambda: open_k2sff(K2SFF_FILE),
+        number=number, repeat=3))/number
+    print('open_k2sff ({} data points):'.format(len(new)))
+    print('  readlines parser  {:8.3f} ms'.format(1e3*tOld))
+    print('  bulk parser       {:8.3f} ms'.format(1e3*tNew))
+    print('  speed-up          {:8.1f}x'.format(tOld/tNew))
+
+
+if __name__ == "__main__":
+    bench_k2sff()
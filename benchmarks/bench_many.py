@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+""" Multi-target dip search with `slidingWindow.dipsearch_many`.
+
+Searches a set of synthetic light curves of similar length one after the
+other with `dipsearch` and all at once with `dipsearch_many`, and checks that
+both give the same dips. Run from the repository root:
+
+    $ python benchmarks/bench_many.py [Ntargets] [Ndata]
+"""
+
+import os
+import sys
+import time
+import numpy as np
+from astropy.table import Table
+
+LCPS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lcps')
+sys.path.insert(0, LCPS_DIR)
+import slidingWindow
+
+
+def synthetic_lightcurves(Ntargets, Ndata, seed=0):
+    """ Light curves with 95-100 % of `Ndata` cadences and a few dips."""
+    rs = np.random.RandomState(seed)
+    lightcurves = []
+    for EPICno in xrange(Ntargets):
+        N = rs.randint(int(0.95*Ndata), Ndata + 1)
+        t = 2000. + 0.0204*np.arange(N)
+        flux = rs.normal(1., 0.001, N).astype(np.float32)
+        for i in rs.randint(0, N - 20, 3):
+            flux[i:i + rs.randint(2, 15)] *= rs.uniform(0.97, 0.99)
+        lightcurves.append((EPICno, Table([t, flux], names=('TIME', 'FLUX'))))
+    return lightcurves
+
+
+def bench_many(Ntargets, Ndata):
+    lightcurves = synthetic_lightcurves(Ntargets, Ndata)
+    params = dict(winSize=50, stepSize=10, Nneighb=1, minDur=2, maxDur=49,
+        detectionThresh=0.98)
+
+    t0 = time.time()
+    single = [slidingWindow.dipsearch(EPICno, photometry, method='vectorized',
+        **params) for EPICno, photometry in lightcurves]
+    tSingle = time.time() - t0
+
+    t0 = time.time()
+    many = slidingWindow.dipsearch_many(lightcurves, **params)
+    tMany = time.time() - t0
+
+    for a, b in zip(single, many):
+        assert len(a) == len(b) and all(a == b)
+    print('{} light curves of ~{} data points, winSize=50, stepSize=10'.format(
+        Ntargets, Ndata))
+    print('  dipsearch (vectorized)  {:8.3f} s'.format(tSingle))
+    print('  dipsearch_many          {:8.3f} s'.format(tMany))
+    print('  speed-up                {:8.1f}x'.format(tSingle/tMany))
+
+
+if __name__ == "__main__":
+    Ntargets = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    Ndata = int(sys.argv[2]) if len(sys.argv) > 2 else 3500
+    bench_many(Ntargets, Ndata)
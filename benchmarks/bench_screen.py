@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+""" Coarse-to-fine dip search with `screenWindows`.
+
+Searches synthetic light curves without dips and with injected dips, once
+exhaustively and once with a coarse screen that selects the windows to be
+searched, and compares run times and the injected dips that both searches
+recover. Run from the repository root:
+
+    $ python benchmarks/bench_screen.py [Ntargets] [Ndata]
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+LCPS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lcps')
+sys.path.insert(0, LCPS_DIR)
+import slidingWindow
+
+
+def synthetic_lightcurves(Ntargets, Ndata, Ndips, seed=0):
+    """ Light curves with `Ndips` box-shaped dips of 2-15 data points whose
+    depths scatter around the detection threshold."""
+    rs = np.random.RandomState(seed)
+    lightcurves = []
+    for EPICno in xrange(Ntargets):
+        t = 2000. + 0.0204*np.arange(Ndata)
+        flux = rs.normal(1., 0.001, Ndata).astype(np.float32)
+        injected = []
+        for i in np.sort(rs.choice(np.arange(100, Ndata - 100, 100), Ndips,
+                replace=False)):
+            duration = rs.randint(2, 15)
+            flux[i:i + duration] *= rs.uniform(0.97, 0.99)
+            injected.append(t[i + duration])
+        lightcurves.append((t, flux, np.array(injected)))
+    return lightcurves
+
+
+def recovered(injected, t_egress, tolerance):
+    """ Number of injected dips with a detected egress within `tolerance`."""
+    t_egress = np.concatenate([[-np.inf], t_egress, [np.inf]])
+    i = np.searchsorted(t_egress, injected)
+    distance = np.minimum(abs(t_egress[i - 1] - injected),
+        abs(t_egress[i] - injected))
+    return int((distance <= tolerance).sum())
+
+
+def bench_screen(Ntargets, Ndata):
+    params = dict(winSize=50, stepSize=10, Nneighb=1, minDur=2, maxDur=49,
+        detectionThresh=0.98)
+    print('{} light curves of {} data points, winSize=50, stepSize=10, '
+        'screenBin=10'.format(Ntargets, Ndata))
+    print('  {:>6s} {:>10s} {:>14s} {:>12s} {:>8s} {:>18s}'.format('dips',
+        'method', 'exhaustive [s]', 'screened [s]', 'ratio',
+        'recall (exh./scr.)'))
+    for Ndips in (0, 5):
+        lightcurves = synthetic_lightcurves(Ntargets, Ndata, Ndips)
+        for method in ('vectorized', 'loop'):
+            t0 = time.time()
+            exhaustive = [slidingWindow.dipsearch_arrays(t, flux,
+                method=method, **params) for t, flux, injected in lightcurves]
+            tExhaustive = time.time() - t0
+
+            t0 = time.time()
+            screened = [slidingWindow.dipsearch_arrays(t, flux, method=method,
+                screenBin=10, **params) for t, flux, injected in lightcurves]
+            tScreened = time.time() - t0
+
+            Ninjected = Nexhaustive = Nscreened = Nsame = 0
+            for (t, flux, injected), a, b in zip(lightcurves, exhaustive,
+                    screened):
+                tolerance = params['winSize']*(t[1] - t[0])
+                Ninjected += len(injected)
+                Nexhaustive += recovered(injected, a[0], tolerance)
+                Nscreened += recovered(injected, b[0], tolerance)
+                Nsame += np.array_equal(a[0], b[0]) and np.array_equal(a[1],
+                    b[1])
+            recall = '{}/{} of {}'.format(Nexhaustive, Nscreened, Ninjected) \
+                if Ninjected else '-'
+            print('  {:6d} {:>10s} {:14.3f} {:12.3f} {:7.1f}x {:>18s}'.format(
+                Ndips, method, tExhaustive, tScreened, tExhaustive/tScreened,
+                recall))
+            print('  {:6s} {:>10s} identical dips in {} of {} light '
+                'curves'.format('', '', Nsame, Ntargets))
+
+
+if __name__ == "__main__":
+    Ntargets = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    Ndata = int(sys.argv[2]) if len(sys.argv) > 2 else 3500
+    bench_screen(Ntargets, Ndata)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+""" Local medians from quantile sketches with `slidingWindow.sketchedMedian`.
+
+Computes the local medians and MADs of a long short-cadence-like light curve
+exactly with `windowedMedian` and approximately with `sketchedMedian` for
+several window sizes and rank errors. Reports run times, the number of
+values whose median is taken per window, and the largest rank error of the
+estimates in a sample of windows relative to the bound (1 for the median, 2
+for the MAD). Run from the repository root:
+
+    $ python benchmarks/bench_sketch.py [Ndata]
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+LCPS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lcps')
+sys.path.insert(0, LCPS_DIR)
+import slidingWindow
+
+
+def synthetic_lightcurve(Ndata, seed=0):
+    """ One-minute-cadence-like light curve with a slow trend, flares and
+    dips."""
+    rs = np.random.RandomState(seed)
+    t = 2000. + np.arange(Ndata)/1440.
+    flux = 1. + 0.002*np.sin(2*np.pi*t/3.) + rs.normal(0., 0.001, Ndata)
+    for i in rs.randint(0, Ndata - 200, Ndata//5000):
+        flux[i:i + rs.randint(20, 200)] *= rs.uniform(0.97, 0.995)
+    for i in rs.randint(0, Ndata - 50, Ndata//20000):
+        flux[i:i + 50] += 0.01*np.exp(-np.arange(50)/10.)
+    return flux.astype(np.float32)
+
+
+def rank_errors(flux, starts, winSize, Nneighb, localMedian, MAD):
+    """ Largest distance of the ranks of the estimates from the middle rank
+    as a fraction of the neighborhood sizes."""
+    errors = [0., 0.]
+    for iWinStart, median, deviation in zip(starts, localMedian, MAD):
+        (iMin, iLeft), (iRight, iMax) = slidingWindow._neighborhood(iWinStart,
+            winSize, Nneighb, len(flux))
+        neighborhood = np.append(flux[iMin:iLeft], flux[iRight:iMax])
+        for i, (values, estimate) in enumerate(((neighborhood, median),
+                (abs(neighborhood - median), deviation))):
+            n = len(values)
+            below, atMost = (values < estimate).sum(), (values <= estimate).sum()
+            errors[i] = max(errors[i], (below - n//2)/float(n),
+                ((n - 1)//2 + 1 - atMost)/float(n))
+    return errors
+
+
+def bench_sketch(Ndata):
+    flux = synthetic_lightcurve(Ndata)
+    print('{} data points, Nneighb=2'.format(Ndata))
+    print('  {:>7s} {:>8s} {:>10s} {:>9s} {:>10s} {:>9s} {:>8s} {:>13s}'\
+        .format('winSize', 'stepSize', 'rankError', 'exact [s]',
+        'sketch [s]', 'speed-up', 'values', 'error/bound'))
+    for winSize, stepSize in ((250, 25), (1000, 50), (3000, 100),
+            (10000, 250)):
+        starts = np.arange(0, Ndata - winSize, stepSize)
+        t0 = time.time()
+        slidingWindow.windowedMedian(flux, winSize, stepSize, 2)
+        tExact = time.time() - t0
+        for rankError in (0.05, 0.02, 0.01):
+            t0 = time.time()
+            localMedian, MAD = slidingWindow.sketchedMedian(flux, winSize,
+                stepSize, 2, rankError)
+            tSketch = time.time() - t0
+            k, m = slidingWindow._sketchLayout(winSize, 2, rankError)
+            sample = slice(None, None, max(1, len(starts)//200))
+            errors = rank_errors(flux, starts[sample], winSize, 2,
+                localMedian[sample], MAD[sample])
+            # every m-th data point of the neighborhood and up to k values
+            # of each of the four partial blocks, or all data points if the
+            # median is exact (m = 1)
+            Nvalues = 4*winSize//m + 4*k if m > 1 else 4*winSize
+            print('  {:7d} {:8d} {:10.2f} {:9.3f} {:10.3f} {:8.1f}x {:8d} '
+                '{:6.2f} {:6.2f}'.format(winSize, stepSize, rankError,
+                tExact, tSketch, tExact/tSketch, Nvalues,
+                errors[0]/rankError, errors[1]/(2*rankError)))
+
+
+if __name__ == "__main__":
+    bench_sketch(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
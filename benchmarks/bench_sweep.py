@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+""" Cost of parameter sweeps with `slidingWindow.dipsweep`.
+
+Searches a synthetic light curve with injected dips for an increasing number
+of detection thresholds, once with `dipsweep` and once with a separate
+`dipsearch` per threshold, and checks that both give the same dips. Run from
+the repository root:
+
+    $ python benchmarks/bench_sweep.py [Ndata]
+"""
+
+import os
+import sys
+import time
+import numpy as np
+from astropy.table import Table
+
+LCPS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lcps')
+sys.path.insert(0, LCPS_DIR)
+import slidingWindow
+
+
+def synthetic_lightcurve(Ndata, Ndips=50, seed=0):
+    """ Long-cadence-like light curve with box-shaped dips."""
+    rs = np.random.RandomState(seed)
+    t = 2000. + 0.0204*np.arange(Ndata)
+    flux = rs.normal(1., 0.001, Ndata).astype(np.float32)
+    for i in rs.randint(0, Ndata - 20, Ndips):
+        flux[i:i + rs.randint(2, 15)] *= rs.uniform(0.97, 0.995)
+    return Table([t, flux], names=('TIME', 'FLUX'))
+
+
+def bench_sweep(Ndata):
+    photometry = synthetic_lightcurve(Ndata)
+    print('{} data points, winSize=50, stepSize=10, Nneighb=1, '
+        'maxDur=5, 10, 20, 49'.format(Ndata))
+    print('  {:>10s} {:>14s} {:>14s} {:>8s}'.format('thresholds',
+        'dipsearch [s]', 'dipsweep [s]', 'ratio'))
+    for Nthresh in (1, 4, 16, 64):
+        configurations = slidingWindow.grid(winSize=[50], stepSize=[10],
+            Nneighb=[1], maxDur=[5, 10, 20, 49],
+            detectionThresh=list(np.linspace(0.97, 0.999, Nthresh)))
+
+        t0 = time.time()
+        separate = [slidingWindow.dipsearch(1, photometry, method='vectorized',
+            **configuration) for configuration in configurations]
+        tSeparate = time.time() - t0
+
+        t0 = time.time()
+        sweep = slidingWindow.dipsweep(1, photometry, configurations)
+        tSweep = time.time() - t0
+
+        for i, dips in enumerate(separate):
+            assert np.array_equal(sweep[sweep['config'] == i]['t_egress'],
+                dips['t_egress'])
+        print('  {:10d} {:14.3f} {:14.3f} {:7.1f}x'.format(Nthresh, tSeparate,
+            tSweep, tSeparate/tSweep))
+
+
+if __name__ == "__main__":
+    bench_sweep(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
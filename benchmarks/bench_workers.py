@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+""" Multi-threaded dip search of a single light curve.
+
+Searches a long synthetic light curve with `slidingWindow.dipsearch_arrays`
+and `method`='vectorized' in a pool of 1, 2, 4 and 8 threads, and checks that
+all searches give the same dips. Run from the repository root:
+
+    $ python benchmarks/bench_workers.py [Ndata]
+"""
+
+import os
+import sys
+import time
+import multiprocessing
+import numpy as np
+
+LCPS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lcps')
+sys.path.insert(0, LCPS_DIR)
+import slidingWindow
+
+
+def synthetic_lightcurve(Ndata, seed=0):
+    """ Short-cadence-like light curve with box-shaped dips."""
+    rs = np.random.RandomState(seed)
+    t = 2000. + np.arange(Ndata)/1440.
+    flux = rs.normal(1., 0.001, Ndata).astype(np.float32)
+    for i in rs.randint(0, Ndata - 20, Ndata//10000):
+        flux[i:i + rs.randint(2, 15)] *= rs.uniform(0.97, 0.995)
+    return t, flux
+
+
+def bench_workers(Ndata):
+    t, flux = synthetic_lightcurve(Ndata)
+    params = dict(winSize=50, stepSize=10, Nneighb=1, minDur=2, maxDur=49,
+        detectionThresh=0.98)
+    print('{} data points, winSize=50, stepSize=10, Nneighb=1, {} CPUs'.format(
+        Ndata, multiprocessing.cpu_count()))
+    print('  {:>7s} {:>10s} {:>9s} {:>6s} {:>10s}'.format('workers',
+        'time [s]', 'speed-up', 'dips', 'identical'))
+    reference = None
+    for workers in (1, 2, 4, 8):
+        t0 = time.time()
+        dips = slidingWindow.dipsearch_arrays(t, flux, method='vectorized',
+            workers=workers, **params)
+        tSearch = time.time() - t0
+        if reference is None:
+            reference, tSingle = dips, tSearch
+        identical = all(np.array_equal(a, b) for a, b in zip(dips, reference))
+        print('  {:7d} {:10.3f} {:8.1f}x {:6d} {:>10s}'.format(workers,
+            tSearch, tSingle/tSearch, len(dips[0]), str(identical)))
+
+
+if __name__ == "__main__":
+    bench_workers(int(sys.argv[1]) if len(sys.argv) > 1 else 5000000)
@@ -16,4 +16,7 @@ if not _ASTROPY_SETUP_:
     import slidingWindow
     import lcps_batch
     import lcps_io
+    import lcps_cache
+    import lcps_archive
+    import lcps_queue
   
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+""" Packed light curve archives.
+
+This module packs a folder of light curve files into a single archive file
+that holds the concatenated TIME and FLUX arrays of all light curves and an
+index with their offsets, lengths and EPIC numbers. Batch jobs read the light
+curves of an archive as zero-copy slices of memory maps instead of opening one
+file per target. It includes an argument parser to pack a folder from the
+shell.
+"""
+
+import os
+import json
+import shutil
+import struct
+import tempfile
+import warnings
+import numpy as np
+from numpy.lib import format
+from lcps_io import open_lightcurve
+
+
+def _write_header(f, dtype, shape):
+    """ Write the header of an array in .npy format, padded so that the data
+    of the array begin at a multiple of 16 bytes from the start of `f`."""
+    header = "{{'descr': {!r}, 'fortran_order': False, 'shape': {!r}, }}"\
+        .format(format.dtype_to_descr(dtype), shape)
+    prefix = format.magic(1, 0)
+    end = f.tell() + len(prefix) + 2 + len(header) + 1
+    header += ' '*(-end % 16) + '\n'
+    f.write(prefix + struct.pack('<H', len(header)) + header.encode('latin1'))
+
+
+def pack(path, archive):
+    """ Pack all light curve files in a folder into a single archive.
+
+    The light curves are read like in `lcps_batch.batchjob` and their TIME and
+    FLUX columns are appended to the archive, together with an index of the
+    file names, EPIC numbers, offsets and lengths. The archive consists of
+    the index, TIME and FLUX arrays written one after the other in .npy
+    format. The fluxes of each light curve keep their own precision, e.g.
+    single precision for Kepler FITS files and double precision for K2SFF
+    files, so that the FLUX array holds their bytes, each block aligned to
+    8 bytes, and the index their data types and byte offsets.
+
+    Parameters
+    ----------
+    path : str
+        folder which contains the light curve files
+    archive : str
+        file name of the archive
+
+    Returns
+    -------
+    N : int
+        number of light curves in the archive
+
+    Example
+    -------
+    >>> import tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> archive = os.path.join(directory, 'tests.lcpa')
+    >>> pack('tests/', archive)
+    2
+    >>> [(EPICno, len(time), flux.dtype.name) for EPICno, time, flux in
+    ...     LightCurveArchive(archive)]
+    [('220132548', 3449, 'float64'), (205919993, 3133, 'float32')]
+    
+    Scanning the archive gives the same log as scanning the folder:
+    
+    >>> import lcps_batch
+    >>> from astropy import log
+    >>> level = log.level
+    >>> log.setLevel('WARNING')
+    >>> for source, logfile in (('tests/', 'folder.log'), (archive,
+    ...         'archive.log')):
+    ...     dips = lcps_batch.batchjob(source, os.path.join(directory,
+    ...         logfile), winSize=50, stepSize=10, maxDur=49)
+    >>> log.setLevel(level)
+    >>> logs = [open(os.path.join(directory, logfile)).read() for logfile in
+    ...     ('folder.log', 'archive.log')]
+    >>> logs[0] == logs[1]
+    True
+    >>> shutil.rmtree(directory)
+    """
+    filelist = sorted([file for file in os.listdir(path)])
+    files, EPICs, lengths, fluxTypes, fluxSizes = [], [], [], [], []
+    timeTmp = tempfile.TemporaryFile()
+    fluxTmp = tempfile.TemporaryFile()
+    try:
+        # read light curves and buffer their data in temporary files
+        for file in filelist:
+            try:
+                EPICno, photometry = open_lightcurve(os.path.join(path, file))
+            except Exception as e:
+                warnings.warn('Cannot open the file "{}" ({})'.format(file, e))
+                continue
+            time = np.asarray(photometry['TIME'], dtype=np.float64)
+            flux = np.asarray(photometry['FLUX'])
+            flux = flux.astype(flux.dtype.newbyteorder('='), copy=False)
+            timeTmp.write(time.tobytes())
+            # pad to keep the fluxes of every light curve aligned
+            fluxBytes = flux.tobytes()
+            fluxTmp.write(fluxBytes + b'\0'*(-len(fluxBytes) % 8))
+            files.append(file)
+            EPICs.append(json.dumps(EPICno))
+            lengths.append(len(time))
+            fluxTypes.append(flux.dtype.str)
+            fluxSizes.append(len(fluxBytes) + -len(fluxBytes) % 8)
+
+        index = np.zeros(len(files), dtype=[
+            ('file', 'S{}'.format(max([len(f) for f in files] + [1]))),
+            ('EPIC', 'S{}'.format(max([len(e) for e in EPICs] + [1]))),
+            ('offset', 'i8'), ('length', 'i8'), ('fluxType', 'S8'),
+            ('fluxOffset', 'i8')])
+        index['file'] = files
+        index['EPIC'] = EPICs
+        index['length'] = lengths
+        index['offset'][1:] = np.cumsum(lengths)[:-1]
+        index['fluxType'] = fluxTypes
+        index['fluxOffset'][1:] = np.cumsum(fluxSizes)[:-1]
+        Ndata = sum(lengths)
+
+        with open(archive, 'wb') as f:
+            format.write_array(f, index)
+            _write_header(f, np.dtype(np.float64), (Ndata,))
+            timeTmp.seek(0)
+            shutil.copyfileobj(timeTmp, f)
+            _write_header(f, np.dtype(np.uint8), (sum(fluxSizes),))
+            fluxTmp.seek(0)
+            shutil.copyfileobj(fluxTmp, f)
+    finally:
+        timeTmp.close()
+        fluxTmp.close()
+    return len(files)
+
+
+class LightCurveArchive(object):
+    """ Read-only access to a light curve archive written by `pack`.
+
+    The TIME and FLUX arrays of the archive are memory-mapped, and the light
+    curves are returned as slices of these maps without copying any data.
+    The fluxes are returned in the precision of their light curve files
+    (archives packed before the precision was kept per light curve hold
+    all fluxes in a common precision).
+
+    Parameters
+    ----------
+    archive : str
+        file name of the archive
+    """
+    def __init__(self, archive):
+        self.archive = archive
+        with open(archive, 'rb') as f:
+            self.index = format.read_array(f)
+            self.time = self._map(f)
+            self.flux = self._map(f)
+
+    def _map(self, f):
+        """ Memory-map the next array in the open archive file `f`."""
+        version = format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = format.read_array_header_2_0(f)
+        offset = f.tell()
+        f.seek(offset + int(np.prod(shape))*dtype.itemsize)
+        if not np.prod(shape):
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(self.archive, dtype=dtype, mode='r', offset=offset,
+            shape=shape)
+
+    @property
+    def files(self):
+        """ Names of the packed light curve files."""
+        return [file.decode('utf-8') for file in self.index['file']]
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        """ EPIC number, time and flux of the `i`-th light curve."""
+        entry = self.index[i]
+        EPICno = json.loads(entry['EPIC'].decode('utf-8'))
+        if not isinstance(EPICno, int):
+            EPICno = str(EPICno)
+        lightcurve = slice(entry['offset'], entry['offset'] + entry['length'])
+        if 'fluxType' not in self.index.dtype.names:
+            return EPICno, self.time[lightcurve], self.flux[lightcurve]
+        fluxType = np.dtype(entry['fluxType'].decode('utf-8'))
+        fluxBytes = slice(entry['fluxOffset'], entry['fluxOffset'] +
+            entry['length']*fluxType.itemsize)
+        return EPICno, self.time[lightcurve], \
+            self.flux[fluxBytes].view(fluxType)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+
+    # parse parameters
+    import argparse
+    parser = argparse.ArgumentParser(\
+        description='pack a folder of light curve files into a single archive')
+    parser.add_argument('path',\
+        help='path containing light curve (FITS or ascii) files', type=str)
+    parser.add_argument('archive',\
+        help='file name of the archive', type=str)
+    args = parser.parse_args()
+
+    pack(args.path, args.archive)
@@ -7,42 +7,596 @@ shell.
 """
 
 import os
-from astropy.table import Table, vstack
-from lcps_io import open_fits, open_csv, open_k2sff
+import csv
+import heapq
+import threading
+import multiprocessing
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import numpy as np
+from astropy.table import Table
+from lcps_io import open_lightcurve
+from lcps_cache import LightCurveCache, BaselineCache
+from lcps_archive import LightCurveArchive
 from astropy import log
 import slidingWindow
 import warnings
 
+
+def _logHeader(winSize, stepSize, Nneighb, minDur, maxDur, detectionThresh,\
+        baseline='median'):
+    """ Header of a dip log with the lcps parameters and column names; the
+    baseline is only listed if it is not the local median."""
+    return '#winSize={}\n#stepSize={}\n#Nneighb={}\n#minDur={}\n#maxDur={}\n#detectionThresh={}\n{}#\nEPIC,t_egress,minFlux\n'.format(\
+        winSize, stepSize, Nneighb, minDur, maxDur, detectionThresh,\
+        '' if baseline == 'median' else '#baseline={}\n'.format(baseline))
+
+
+class DipWriter(object):
+    """ Append-only writer of dip log files.
+    
+    DipWriter writes the lcps parameters as a header once and then appends
+    the dips of each target as they are found, so that the cost of writing
+    grows with the number of new dips only. Each call of `write` hands its
+    dips to the operating system, and the file is synced to disk every
+    `syncEvery` calls.
+    
+    Parameters
+    ----------
+    logfile : str
+        output file for dips
+    winSize, stepSize, Nneighb, minDur, maxDur, detectionThresh, baseline
+        lcps parameters that are written to the header
+    syncEvery : int
+        number of `write` calls between two syncs to disk
+    append : bool
+        append to an existing log with the same parameters instead of
+        starting a new one
+        
+    Example
+    -------
+    >>> import shutil, tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> logfile = os.path.join(directory, 'dips.log')
+    >>> with DipWriter(logfile, 10, 1, 1, 2, 5, 0.995) as writer:
+    ...     writer.write({'EPIC': [1], 't_egress': [2.5], 'minFlux': [0.98]})
+    >>> print(open(logfile).read())
+    #winSize=10
+    #stepSize=1
+    #Nneighb=1
+    #minDur=2
+    #maxDur=5
+    #detectionThresh=0.995
+    #
+    EPIC,t_egress,minFlux
+    1,2.5,0.98
+    <BLANKLINE>
+    >>> shutil.rmtree(directory)
+    """
+    names = ('EPIC', 't_egress', 'minFlux')
+    
+    def __init__(self, logfile, winSize, stepSize, Nneighb, minDur, maxDur,\
+            detectionThresh, baseline='median', syncEvery=50, append=False):
+        # write lcps parameters to beginning of file
+        self._open(logfile, _logHeader(winSize, stepSize, Nneighb, minDur,\
+            maxDur, detectionThresh, baseline), syncEvery, append)
+        
+    def _open(self, logfile, header, syncEvery, append=False):
+        self.logfile = logfile
+        self.syncEvery = syncEvery
+        self._Nwrites = 0
+        if append and os.path.isfile(logfile):
+            with open(logfile, 'r') as f:
+                if f.read(len(header)) != header:
+                    raise ValueError('cannot append to "{}" with different '\
+                        'parameters'.format(logfile))
+            self._file = open(logfile, 'a')
+        else:
+            self._file = open(logfile, 'w')
+            self._file.write(header)
+        
+    @staticmethod
+    def _row(EPIC, t_egress, minFlux):
+        return '{},{!r},{!r}\n'.format(EPIC, float(t_egress), float(minFlux))
+        
+    def write(self, dips):
+        """ Append dips (a table, `DipBuffer` or dict of columns) to the log."""
+        self._file.write(''.join([self._row(*row) for row in\
+            zip(*[dips[name] for name in self.names])]))
+        self._file.flush()
+        self._Nwrites += 1
+        if self._Nwrites % self.syncEvery == 0:
+            self.sync()
+            
+    def sync(self):
+        """ Flush the log and sync it to disk."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SweepWriter(DipWriter):
+    """ Append-only writer of the dip logs of parameter sweeps.
+    
+    Like `DipWriter`, but the header lists the parameters of all
+    configurations of the sweep, and every dip is tagged with the index of
+    its configuration.
+    
+    Parameters
+    ----------
+    logfile : str
+        output file for dips
+    configurations : list
+        parameter configurations of `slidingWindow.dipsweep`
+    syncEvery : int
+        number of `write` calls between two syncs to disk
+        
+    Example
+    -------
+    >>> import shutil, tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> logfile = os.path.join(directory, 'sweep.log')
+    >>> with SweepWriter(logfile, [{'winSize': 20}, {'winSize': 30}]) as writer:
+    ...     writer.write({'config': [1], 'EPIC': [1], 't_egress': [2.5],
+    ...         'minFlux': [0.98]})
+    >>> print(open(logfile).read())
+    #config=0,winSize=20,stepSize=1,Nneighb=2,minDur=2,maxDur=5,detectionThresh=0.995
+    #config=1,winSize=30,stepSize=1,Nneighb=2,minDur=2,maxDur=5,detectionThresh=0.995
+    #
+    config,EPIC,t_egress,minFlux
+    1,1,2.5,0.98
+    <BLANKLINE>
+    >>> shutil.rmtree(directory)
+    """
+    names = ('config', 'EPIC', 't_egress', 'minFlux')
+    
+    def __init__(self, logfile, configurations, syncEvery=50):
+        header = ''.join(['#config={},winSize={},stepSize={},Nneighb={},minDur={},maxDur={},detectionThresh={}\n'.format(\
+            i, *slidingWindow._sweepParameters(configuration)) for\
+            i, configuration in enumerate(configurations)])
+        self._open(logfile, header + '#\n' + ','.join(self.names) + '\n',\
+            syncEvery)
+        
+    @staticmethod
+    def _row(config, EPIC, t_egress, minFlux):
+        return '{},{},{!r},{!r}\n'.format(config, EPIC, float(t_egress),\
+            float(minFlux))
+
+
+class Journal(object):
+    """ Append-only record of the files that a batch job has completed.
+    
+    Each entry holds the name, size and modification time of a file, the
+    number of dips found in it and the status of the scan ('ok' or 'error').
+    Entries are written in the same order as the dips of the files to the
+    `DipWriter` of the batch job, so that the dips of the n-th entry are the
+    rows following those of all previous entries. Entries are synced to disk
+    every `syncEvery` calls of `append`.
+    
+    Parameters
+    ----------
+    filename : str
+        file name of the journal
+    entries : list
+        entries to start the journal with, e.g. those of `Journal.read`
+    syncEvery : int
+        number of `append` calls between two syncs to disk
+    append : bool
+        continue an existing journal instead of starting a new one
+        
+    Example
+    -------
+    >>> import shutil, tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> filename = os.path.join(directory, 'dips.log.journal')
+    >>> with Journal(filename) as journal:
+    ...     journal.append('220132548', 351069, 1525340515.0, 2)
+    >>> Journal.read(filename)
+    [('220132548', 351069, 1525340515.0, 2, 'ok')]
+    >>> shutil.rmtree(directory)
+    """
+    names = ('file', 'size', 'mtime', 'ndips', 'status')
+    
+    def __init__(self, filename, entries=(), syncEvery=50, append=False):
+        self.filename = filename
+        self.syncEvery = syncEvery
+        self._Nwrites = 0
+        append = append and os.path.isfile(filename) and \
+            os.path.getsize(filename) > 0
+        self._file = open(filename, 'ab' if append else 'wb')
+        self._writer = csv.writer(self._file, lineterminator='\n')
+        if not append:
+            self._writer.writerow(self.names)
+        for entry in entries:
+            self._writer.writerow(self._fields(*entry))
+        self.sync()
+        
+    @staticmethod
+    def _fields(file, size, mtime, ndips, status):
+        return [file, size, repr(mtime), ndips, status]
+        
+    @classmethod
+    def read(cls, filename):
+        """ Return the complete entries of a journal as a list of tuples
+        (file, size, mtime, ndips, status)."""
+        with open(filename, 'rb') as f:
+            content = f.read()
+        # the last line is incomplete if a run was interrupted while writing it
+        lines = content.split(b'\n')[1:-1]
+        return [(file, int(size), float(mtime), int(ndips), status) for\
+            file, size, mtime, ndips, status in csv.reader(lines)]
+        
+    def append(self, file, size, mtime, ndips, status='ok'):
+        """ Record a completed file."""
+        self._writer.writerow(self._fields(file, size, mtime, ndips, status))
+        self._file.flush()
+        self._Nwrites += 1
+        if self._Nwrites % self.syncEvery == 0:
+            self.sync()
+            
+    def sync(self):
+        """ Flush the journal and sync it to disk."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _restore(logfile, header, identities):
+    """ Collect the results of a previous run of a batch job.
+    
+    Reads the journal of the run and the dips it logged, either to the
+    preliminary log `logfile`.part of an interrupted run or to `logfile`.
+    Entries of files that are missing or changed since (according to
+    `identities`, a dict of file names and their (size, mtime)) and of files
+    that could not be scanned are dropped together with their dips, and so
+    are dips that were logged without a journal entry.
+    
+    Returns
+    -------
+    entries : list
+        journal entries of the files that do not need to be scanned again
+    dips : dict
+        columns of the dips of these files
+    """
+    entries = Journal.read(logfile + '.journal')
+    rows = []
+    for oldlog in (logfile + '.part', logfile):
+        if os.path.isfile(oldlog):
+            with open(oldlog, 'r') as f:
+                content = f.read()
+            if not content.startswith(header):
+                raise ValueError('cannot resume "{}" with different parameters'\
+                    .format(oldlog))
+            rows = content[len(header):].split('\n')[:-1]
+            break
+    
+    completed = []
+    dips = {'EPIC': [], 't_egress': [], 'minFlux': []}
+    iRow = 0
+    for entry in entries:
+        file, size, mtime, ndips, status = entry
+        if iRow + ndips > len(rows):
+            break
+        if status == 'ok' and identities.get(file) == (size, mtime):
+            completed.append(entry)
+            for row in rows[iRow:iRow + ndips]:
+                EPICno, t_egress, minFlux = row.split(',')
+                dips['EPIC'].append(EPICno)
+                dips['t_egress'].append(float(t_egress))
+                dips['minFlux'].append(float(minFlux))
+        iRow += ndips
+    return completed, dips
+
+
+def _listTargets(path):
+    """ List the light curves in a folder or light curve archive.
+    
+    Returns
+    -------
+    archive : str
+        `path` if it is a light curve archive, else None
+    filelist : list
+        sorted file names of the light curves
+    targets : list
+        targets of `_loadTarget`, i.e. file paths or indices in the archive
+    identities : list
+        (size, mtime) of the files, or (number of cadences, mtime of the
+        archive) of the light curves in an archive
+    """
+    if os.path.isfile(path):
+        archive = path
+        archiveData = LightCurveArchive(archive)
+        filelist = archiveData.files
+        targets = range(len(filelist))
+        mtime = os.stat(archive).st_mtime
+        identities = [(int(length), mtime) for length in\
+            archiveData.index['length']]
+    else:
+        archive = None
+        filelist = sorted([file for file in os.listdir(path)])
+        targets = [path + file for file in filelist]
+        identities = []
+        for target in targets:
+            stat = os.stat(target)
+            identities.append((stat.st_size, stat.st_mtime))
+    return archive, filelist, targets, identities
+
+
+def _shard(sizes, shard, nshards):
+    """ Indices of the files that belong to a shard of a batch job.
+    
+    Files are distributed greedily from the largest to the smallest to the
+    shard with the smallest total size, so that all shards hold about the
+    same amount of data. The result only depends on the sizes and order of
+    the files. The indices of each shard are returned in ascending order.
+    
+    Example
+    -------
+    >>> [_shard([5, 1, 4, 2, 3], i, 2) for i in range(2)]
+    [[0, 1, 3], [2, 4]]
+    """
+    if not 0 <= shard < nshards:
+        raise ValueError('shard must be between 0 and nshards - 1')
+    loads = [(0, i) for i in range(nshards)]
+    members = [[] for i in range(nshards)]
+    for size, i in sorted([(-size, i) for i, size in enumerate(sizes)]):
+        load, iShard = heapq.heappop(loads)
+        members[iShard].append(i)
+        heapq.heappush(loads, (load - size, iShard))
+    return sorted(members[shard])
+
+
+def _readLog(logfile):
+    """ Return the header and a generator of the rows of a dip log."""
+    f = open(logfile, 'r')
+    header = []
+    for line in f:
+        header.append(line)
+        if not line.startswith('#'):
+            break
+    
+    def rows():
+        with f:
+            for row in f:
+                yield row
+    return ''.join(header), rows()
+
+
+def _rowKey(row):
+    """ Sort key (EPIC, t_egress) of a row of a dip log; numerical EPIC
+    numbers precede file names."""
+    EPICno, t_egress, minFlux = row.rsplit(',', 2)
+    try:
+        return (0, int(EPICno), float(t_egress))
+    except ValueError:
+        return (1, EPICno, float(t_egress))
+
+
+def merge(logfiles, outfile):
+    """ Merge dip logs, e.g. of the shards of a batch job, into one log.
+    
+    The rows of all logs are merged into a single log sorted by EPIC number
+    and egress time. Logs that are not sorted already are sorted in memory,
+    the others are merged while they are read.
+    
+    Parameters
+    ----------
+    logfiles : list
+        dip logs written by `batchjob` or `lcps_output` with the same 
+        parameters
+    outfile : str
+        file name of the merged log
+    
+    Returns
+    -------
+    N : int
+        number of dips in the merged log
+    """
+    headers, streams = [], []
+    for logfile in logfiles:
+        header, rows = _readLog(logfile)
+        if headers and header != headers[0]:
+            raise ValueError('the parameters of "{}" and "{}" differ'.format(\
+                logfiles[0], logfile))
+        headers.append(header)
+        
+        # check whether the log is sorted without keeping it in memory
+        keys = (_rowKey(row) for row in rows)
+        previous = next(keys, None)
+        for key in keys:
+            if key < previous:
+                streams.append(iter(sorted(_readLog(logfile)[1], key=_rowKey)))
+                break
+            previous = key
+        else:
+            streams.append(_readLog(logfile)[1])
+    
+    N = 0
+    with open(outfile, 'w') as f:
+        f.write(headers[0] if headers else '')
+        for row in heapq.merge(*[((_rowKey(row), row) for row in stream)\
+                for stream in streams]):
+            f.write(row[1])
+            N += 1
+    return N
+
+
 def lcps_output(logtable, logfile, winSize, stepSize, Nneighb, minDur, maxDur,\
     detectionThresh):
     """ Write table with dips to file."""
-#    if os.path.isfile(logfile):
-#        # append to existing logfile 
-#        oldlog = ascii.read(logfile, format='csv')
-#        logtable = vstack([oldlog, logtable])
-    logtable.write(logfile, format='csv')
-    
-    # write lcps parameters to beginning of file
-    prepends = '#winSize={}\n#stepSize={}\n#Nneighb={}\n#minDur={}\n#maxDur={}\n#detectionThresh={}\n#'.format(\
-    winSize, stepSize, Nneighb, minDur, maxDur, detectionThresh)
-    with open(logfile, 'r+') as f:
-        content = f.read()
-        f.seek(0,0)
-        f.write(prepends + '\n' + content)
+    with DipWriter(logfile, winSize, stepSize, Nneighb, minDur, maxDur,\
+            detectionThresh) as writer:
+        writer.write(logtable)
         
 
+# light curve cache, archive and baseline cache of the current process (see
+# `_initWorker`)
+_cache = None
+_archive = None
+_baselineCache = None
+
+def _initWorker(cacheDir=None, cacheSize=2048., archive=None,\
+        baselineDir=None, baselineSize=2048.):
+    """ Set up the light curve sources and the baseline cache of a process
+    that runs `_scanFile`."""
+    global _cache, _archive, _baselineCache
+    _cache = LightCurveCache(cacheDir, cacheSize) if cacheDir else None
+    _archive = LightCurveArchive(archive) if archive else None
+    _baselineCache = BaselineCache(baselineDir, baselineSize) if baselineDir\
+        else None
+
+
+def _open_target(target):
+    """ Extract EPIC number, time and flux arrays of a light curve file, or of
+    the light curve with index `target` in the archive."""
+    if _archive is not None:
+        return _archive[target]
+    elif _cache is not None:
+        EPICno, photometry = _cache.load(target, open_lightcurve)
+    else:
+        EPICno, photometry = open_lightcurve(target)
+    return EPICno, np.asarray(photometry['TIME']), \
+        np.asarray(photometry['FLUX'])
+
+
+def _loadTarget(target):
+    """ Open a light curve; a failure is returned as an error message."""
+    try:
+        EPICno, time, flux = _open_target(target)
+    except Exception as e:
+        return None, None, None, '{}: {}'.format(type(e).__name__, e)
+    return EPICno, time, flux, None
+
+
+def _searchTarget(lightcurve, params):
+    """ Search a light curve loaded by `_loadTarget` for dips; a failure is
+    returned as an error message."""
+    EPICno, time, flux, error = lightcurve
+    if error:
+        return None, None, error
+    winSize, stepSize, Nneighb, minDur, maxDur, detectionThresh, baseline =\
+        params
+    try:
+        t_egress, minFlux = slidingWindow.dipsearch_arrays(time, flux,\
+            winSize, stepSize, Nneighb, minDur, maxDur, detectionThresh,\
+            baselineCache=_baselineCache, baseline=baseline)
+        dips = slidingWindow.DipBuffer(len(t_egress))
+        dips.extend_target(EPICno, t_egress, minFlux)
+    except Exception as e:
+        return None, None, '{}: {}'.format(type(e).__name__, e)
+    return EPICno, dips, None
+
+
+def _sweepTarget(lightcurve, configurations):
+    """ Search a light curve loaded by `_loadTarget` for dips with several
+    parameter configurations; a failure is returned as an error message."""
+    EPICno, time, flux, error = lightcurve
+    if error:
+        return None, None, error
+    try:
+        photometry = Table([time, flux], names=('TIME', 'FLUX'), copy=False)
+        dips = slidingWindow.dipsweep(EPICno, photometry, configurations,\
+            _baselineCache)
+    except Exception as e:
+        return None, None, '{}: {}'.format(type(e).__name__, e)
+    return EPICno, dips, None
+
+
+def _scanFile(task):
+    """ Open a light curve file and search it for dips.
+    
+    Runs in the worker processes of `batchjob`, so any failure is returned as
+    an error message instead of being raised.
+    """
+    target, params, search = task
+    return search(_loadTarget(target), params)
+
+
+def _scanTargets(targets, search, params, workers, prefetch, initArgs):
+    """ Open light curves and search them for dips with `search`
+    (`_searchTarget` or `_sweepTarget`), in worker processes if requested.
+    Every process is set up by `_initWorker` with the arguments `initArgs`.
+    
+    Returns an iterator of the results of `search` in the order of `targets`
+    and the pool of worker processes (None for a single process).
+    """
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, _initWorker, initArgs)
+        tasks = [(target, params, search) for target in targets]
+        chunksize = max(1, min(16, len(tasks)//(4*workers)))
+        return pool.imap(_scanFile, tasks, chunksize), pool
+    
+    _initWorker(*initArgs)
+    if prefetch > 0:
+        lightcurves = _prefetch(_loadTarget, targets, prefetch)
+    else:
+        lightcurves = (_loadTarget(target) for target in targets)
+    return (search(lightcurve, params) for lightcurve in lightcurves), None
+
+
+def _prefetch(function, items, depth):
+    """ Yield `function(item)` for all items, computed ahead of time in a
+    background thread that holds at most `depth` results."""
+    results = queue.Queue(depth)
+    done = object()
+    
+    def readAhead():
+        for item in items:
+            results.put(function(item))
+        results.put(done)
+    
+    thread = threading.Thread(target=readAhead)
+    thread.daemon = True
+    thread.start()
+    while True:
+        result = results.get()
+        if result is done:
+            break
+        yield result
+
+
 def batchjob(path, logfile='./dips.log', winSize=10, stepSize=1,\
-        Nneighb=1, minDur=2, maxDur=5, detectionThresh=0.995):
+        Nneighb=1, minDur=2, maxDur=5, detectionThresh=0.995, workers=1,\
+        cacheDir=None, cacheSize=2048., prefetch=4, syncEvery=50,\
+        resume=False, shard=0, nshards=1, baselineDir=None,\
+        baselineSize=2048., baseline='median'):
     """ Check all light curve files in a folder for transit signatures.
     
     batchjob forwards all FITS files in the `path` to the dip search of the 
-    `slidingWindow` module. Any detected dips are stored in an Astropy table
+    `slidingWindow` module. Any detected dips are collected in a `DipBuffer`
     `candidates` together with the EPIC number of the target.
     
+    Dips are streamed to the file `logfile`.part while the job runs, and each
+    completed file is recorded in the journal `logfile`.journal. An
+    interrupted job can be continued with `resume`.
+    
     Parameters
     ----------
     path : str
-        folder which is scanned for fits files
+        folder which is scanned for fits files, or a light curve archive
+        written by `lcps_archive.pack`
     logfile : str
         output file for dips
     winSize : int
@@ -59,6 +613,44 @@ def batchjob(path, logfile='./dips.log', winSize=10, stepSize=1,\
         maximum dip duration in # of data points
     detectionThresh : float
         fraction of flux below which a dip is registered
+    workers : int
+        Number of processes that open and scan light curve files in parallel.
+        Results are collected in the same order as with a single process.
+    cacheDir : str
+        directory of a `LightCurveCache` that keeps the photometry of scanned
+        files for later runs (Default: no caching)
+    cacheSize : float
+        maximum size of the light curve cache in MB
+    prefetch : int
+        Number of light curves that a single process (`workers`=1) reads ahead
+        in a background thread while the current one is searched for dips
+        (0 reads them one after the other)
+    syncEvery : int
+        Number of targets after which intermediate results in the file
+        `logfile`.part and the journal are synced to disk
+    resume : bool
+        Skip the files that the journal of a previous run with the same
+        parameters lists as scanned, and keep their dips. Files that were
+        changed since or could not be scanned are scanned again.
+    shard : int
+        index of the subset of files that is scanned (0 <= `shard` <
+        `nshards`)
+    nshards : int
+        Number of subsets that the files are divided into, e.g. to scan them
+        on several machines. Subsets have about the same total file size (or
+        number of cadences in an archive), and the logs of all subsets can
+        be combined with `merge`.
+    baselineDir : str
+        directory of a `BaselineCache` that keeps the local medians and MADs
+        of all light curves, so that later runs with the same `winSize`,
+        `stepSize` and `Nneighb` but other thresholds or dip durations skip
+        their computation (Default: no caching)
+    baselineSize : float
+        maximum size of the baseline cache in MB
+    baseline : str
+        local flux level that dips are compared with: 'median' (Default),
+        'mean', 'clipped-mean' or 'sketch' with a rank error of 1 % (see
+        `slidingWindow.dipsearch`)
     
     Returns
     -------    
@@ -67,60 +659,154 @@ def batchjob(path, logfile='./dips.log', winSize=10, stepSize=1,\
         
     Example
     -------
+    >>> import shutil, tempfile
+    >>> directory = tempfile.mkdtemp()
     >>> path = './tests/'
-    >>> batchjob(path)
+    >>> batchjob(path, os.path.join(directory, 'dips.log'))
     INFO: Scanning target 1/2: EPIC 220132548 [__main__]
     INFO: Dips detected in 1 light curves. [__main__]
     INFO: Scanning target 2/2: EPIC 205919993 [__main__]
     INFO: Dips detected in 2 light curves. [__main__]
     INFO: 17 dips found in 2 light curves. [__main__]
+    >>> shutil.rmtree(directory)
     """
-    filelist = sorted([file for file in os.listdir(path)])
-    candidates = Table(names=('EPIC','t_egress','minFlux'),\
-        dtype=['i8',float,float])
+    slidingWindow._checkParameters(winSize, minDur, maxDur)
+    if baseline not in ('median', 'mean', 'clipped-mean', 'sketch'):
+        raise ValueError('unknown baseline "{}"'.format(baseline))
+    archive, filelist, targets, identities = _listTargets(path)
+    if nshards > 1:
+        members = _shard([size for size, mtime in identities], shard, nshards)
+        filelist = [filelist[i] for i in members]
+        targets = [targets[i] for i in members]
+        identities = [identities[i] for i in members]
+    candidates = slidingWindow.DipBuffer()
+    header = _logHeader(winSize, stepSize, Nneighb, minDur, maxDur,\
+        detectionThresh, baseline)
+    
+    # continue a previous run by skipping the files in its journal
+    completed, restored = [], None
+    if resume and os.path.isfile(logfile + '.journal'):
+        completed, restored = _restore(logfile, header,\
+            dict(zip(filelist, identities)))
+        done = set(entry[0] for entry in completed)
+        remaining = [i for i, file in enumerate(filelist) if file not in done]
+        log.info('Resuming: {} of {} files were scanned before.'.format(\
+            len(filelist) - len(remaining), len(filelist)))
+        filelist = [filelist[i] for i in remaining]
+        targets = [targets[i] for i in remaining]
+        identities = [identities[i] for i in remaining]
+    
+    # Open light curves and search for transit signatures via sliding window
+    # algorithm, in worker processes if requested
+    params = (winSize, stepSize, Nneighb, minDur, maxDur, detectionThresh,\
+        baseline)
+    results, pool = _scanTargets(targets, _searchTarget, params, workers,\
+        prefetch, (cacheDir, cacheSize, archive, baselineDir, baselineSize))
+    
+    # dips are appended to a preliminary log file as they are found, and the
+    # scanned files to the journal
+    partfile = DipWriter(logfile + '.part', winSize, stepSize, Nneighb,\
+        minDur, maxDur, detectionThresh, baseline, syncEvery)
+    if restored is not None:
+        candidates.extend(restored)
+        partfile.write(restored)
+        partfile.sync()
+    journal = Journal(logfile + '.journal', completed, syncEvery)
     nodips = 0
-    for i, file in enumerate(filelist):
-        # extract photometry from file
-        if file.endswith('fits'):
-            EPICno, photometry = open_fits(path + file)
-        elif file.endswith('csv'):
-            try:
-                EPICno, photometry = open_csv(path + file)
-            except:
-                warnings.warn('Cannot open file ``{}''.'.format(file))
-                continue
-        else:
-            try:
-                EPICno, photometry = open_k2sff(path + file)
-            except:
-                warnings.warn('Cannot open the file "{}"'.format(file))
-                continue         
+    for i, (EPICno, dips, error) in enumerate(results):
+        if error:
+            warnings.warn('Cannot scan the file "{}" ({})'.format(filelist[i],
+                error))
+            journal.append(filelist[i], identities[i][0], identities[i][1],\
+                0, 'error')
+            continue
         log.info('Scanning target {}/{}: EPIC {}'.format(i + 1,\
             len(filelist),EPICno))
-        
-        # Search for transit signatures via sliding window algorithm
-        dips = slidingWindow.dipsearch(EPICno, photometry, winSize, stepSize,\
-            Nneighb, minDur, maxDur, detectionThresh)
-        candidates = vstack([candidates, dips], join_type='outer')
+        candidates.extend(dips)
+        partfile.write(dips)
+        journal.append(filelist[i], identities[i][0], identities[i][1],\
+            len(dips))
         if dips:
             nodips+=1
             log.info('Dips detected in {} light curves.'.format(nodips))
         
-        # Every 50th iteration, write intermediate results to file
-        if i % 50 == 0:
-            lcps_output(candidates, logfile + '.part', winSize, stepSize, \
-            Nneighb, minDur, maxDur, detectionThresh)
-        
-    # write dips to file
-    lcps_output(candidates, logfile, winSize, stepSize, Nneighb, minDur, maxDur,\
-    detectionThresh)
-    try:
-        os.remove(logfile + '.part')
-    except OSError:
-        pass
+    if pool is not None:
+        pool.close()
+        pool.join()
+    
+    # the complete log replaces the preliminary one
+    partfile.close()
+    journal.close()
+    os.rename(logfile + '.part', logfile)
     
     log.info('{} dips found in {} light curves.'.format(\
         len(candidates), len(set(candidates['EPIC']))))
+
+
+def sweepjob(path, configurations, logfile='./sweep.log', workers=1,\
+        cacheDir=None, cacheSize=2048., prefetch=4, syncEvery=50,\
+        baselineDir=None, baselineSize=2048.):
+    """ Search all light curves in a folder for dips with many parameter
+    configurations.
+    
+    sweepjob reads every light curve once and searches it with all
+    configurations at once with `slidingWindow.dipsweep`. The dips of all
+    configurations are written to a single log, tagged with the index of
+    their configuration. Like with `batchjob`, dips are streamed to
+    `logfile`.part while the job runs.
+    
+    Parameters
+    ----------
+    path : str
+        folder which is scanned for fits files, or a light curve archive
+        written by `lcps_archive.pack`
+    configurations : list
+        dicts of parameters of the dip search (winSize, stepSize, Nneighb,
+        minDur, maxDur, detectionThresh), e.g. from `slidingWindow.grid`
+    logfile : str
+        output file for dips
+    workers, cacheDir, cacheSize, prefetch, syncEvery, baselineDir, baselineSize
+        see `batchjob`
+    
+    Example
+    -------
+    >>> import shutil, tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> configurations = slidingWindow.grid(winSize=[50], stepSize=[10],
+    ...     maxDur=[49], detectionThresh=[0.98, 0.99])
+    >>> sweepjob('./tests/', configurations, os.path.join(directory,
+    ...     'sweep.log'))
+    INFO: 24 dips of 2 configurations found in 2 light curves. [__main__]
+    >>> shutil.rmtree(directory)
+    """
+    for configuration in configurations:
+        winSize, stepSize, Nneighb, minDur, maxDur, detectionThresh = \
+            slidingWindow._sweepParameters(configuration)
+        slidingWindow._checkParameters(winSize, minDur, maxDur)
+    archive, filelist, targets, identities = _listTargets(path)
+    results, pool = _scanTargets(targets, _sweepTarget, configurations,\
+        workers, prefetch, (cacheDir, cacheSize, archive, baselineDir,\
+        baselineSize))
+    
+    Ndips, EPICs = 0, set()
+    with SweepWriter(logfile + '.part', configurations, syncEvery) as partfile:
+        for i, (EPICno, dips, error) in enumerate(results):
+            if error:
+                warnings.warn('Cannot scan the file "{}" ({})'.format(\
+                    filelist[i], error))
+                continue
+            log.debug('Scanning target {}/{}: EPIC {}'.format(i + 1,\
+                len(filelist), EPICno))
+            partfile.write(dips)
+            Ndips += len(dips)
+            if dips:
+                EPICs.add(EPICno)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    os.rename(logfile + '.part', logfile)
+    log.info('{} dips of {} configurations found in {} light curves.'.format(\
+        Ndips, len(configurations), len(EPICs)))
     
     
 if __name__ == "__main__":
@@ -128,29 +814,115 @@ if __name__ == "__main__":
     doctest.testmod()
     
     # parse parameters
+    import sys
     import argparse
     parser = argparse.ArgumentParser(\
         description='pre-select light curves with possible transit signatures')
-    parser.add_argument('path',\
-        help='path containing light curve (FITS or ascii) files', type=str)
-    parser.add_argument('--logfile', default='./dips.log',\
+    commands = parser.add_subparsers(dest='command')
+
+    batchParser = commands.add_parser('batch',\
+        help='search light curves for dips (default command)')
+    batchParser.add_argument('path',\
+        help='path containing light curve (FITS or ascii) files, or a light curve archive',\
+        type=str)
+    batchParser.add_argument('--logfile', default='./dips.log',\
         help='name of log file that will contain dips', type=str)  
-    parser.add_argument('--winSize', default=50,\
+    batchParser.add_argument('--winSize', default=50,\
         help='Size of a sliding window', type=int)
-    parser.add_argument('--stepSize', default=10,\
+    batchParser.add_argument('--stepSize', default=10,\
         help='steps per slide (Default = 1, i.e. slide one data point per iteration)', type=int)
-    parser.add_argument('--Nneighb', default=1,\
+    batchParser.add_argument('--Nneighb', default=1,\
         help='Number of neighboring windows to be considered for the local median', type=int)
-    parser.add_argument('--minDur', default=2,\
+    batchParser.add_argument('--minDur', default=2,\
         help='minimum dip duration in # of data points', type=int)
-    parser.add_argument('--maxDur', default=49,\
+    batchParser.add_argument('--maxDur', default=49,\
         help='maximum dip duration in # of data points', type=int)
-    parser.add_argument('--detectionThresh', default=0.98,\
+    batchParser.add_argument('--detectionThresh', default=0.98,\
         help='fraction of flux below which a dip is registered', type=float)
-    args = parser.parse_args()
-    
-    batchjob(args.path, args.logfile, args.winSize, args.stepSize,\
-        args.Nneighb, args.minDur, args.maxDur, args.detectionThresh)
+    batchParser.add_argument('--workers', default=1,\
+        help='number of processes that scan light curves in parallel', type=int)
+    batchParser.add_argument('--cache-dir', default=None,\
+        help='directory of a cache for the photometry of scanned files', type=str)
+    batchParser.add_argument('--cache-size', default=2048.,\
+        help='maximum size of the light curve cache in MB', type=float)
+    batchParser.add_argument('--prefetch', default=4,\
+        help='number of light curves read ahead by a single process', type=int)
+    batchParser.add_argument('--sync-every', default=50,\
+        help='number of targets between syncs of intermediate results', type=int)
+    batchParser.add_argument('--resume', action='store_true',\
+        help='skip the files that a previous run with the same log file scanned')
+    batchParser.add_argument('--shard', default=0,\
+        help='index of the subset of files to scan (0 ... nshards-1)', type=int)
+    batchParser.add_argument('--nshards', default=1,\
+        help='number of subsets of about equal size to divide the files into', type=int)
+    batchParser.add_argument('--baseline-cache', default=None,\
+        help='directory of a cache for the local medians of scanned light curves', type=str)
+    batchParser.add_argument('--baseline-cache-size', default=2048.,\
+        help='maximum size of the baseline cache in MB', type=float)
+    batchParser.add_argument('--baseline', default='median',\
+        choices=('median', 'mean', 'clipped-mean', 'sketch'),\
+        help='local flux level that dips are compared with', type=str)
+
+    sweepParser = commands.add_parser('sweep',\
+        help='search light curves with all combinations of parameters')
+    sweepParser.add_argument('path',\
+        help='path containing light curve (FITS or ascii) files, or a light curve archive',\
+        type=str)
+    sweepParser.add_argument('--logfile', default='./sweep.log',\
+        help='name of log file that will contain dips', type=str)
+    sweepParser.add_argument('--winSize', default=[50], nargs='+',\
+        help='Sizes of a sliding window', type=int)
+    sweepParser.add_argument('--stepSize', default=[10], nargs='+',\
+        help='steps per slide', type=int)
+    sweepParser.add_argument('--Nneighb', default=[1], nargs='+',\
+        help='Numbers of neighboring windows to be considered for the local median', type=int)
+    sweepParser.add_argument('--minDur', default=[2], nargs='+',\
+        help='minimum dip durations in # of data points', type=int)
+    sweepParser.add_argument('--maxDur', default=[49], nargs='+',\
+        help='maximum dip durations in # of data points', type=int)
+    sweepParser.add_argument('--detectionThresh', default=[0.98], nargs='+',\
+        help='fractions of flux below which a dip is registered', type=float)
+    sweepParser.add_argument('--workers', default=1,\
+        help='number of processes that scan light curves in parallel', type=int)
+    sweepParser.add_argument('--cache-dir', default=None,\
+        help='directory of a cache for the photometry of scanned files', type=str)
+    sweepParser.add_argument('--cache-size', default=2048.,\
+        help='maximum size of the light curve cache in MB', type=float)
+    sweepParser.add_argument('--prefetch', default=4,\
+        help='number of light curves read ahead by a single process', type=int)
+    sweepParser.add_argument('--baseline-cache', default=None,\
+        help='directory of a cache for the local medians of scanned light curves', type=str)
+    sweepParser.add_argument('--baseline-cache-size', default=2048.,\
+        help='maximum size of the baseline cache in MB', type=float)
+
+    mergeParser = commands.add_parser('merge',\
+        help='merge the dip logs of several batch jobs')
+    mergeParser.add_argument('logfiles', nargs='+',\
+        help='dip logs written with the same parameters', type=str)
+    mergeParser.add_argument('--logfile', default='./dips.log',\
+        help='name of the merged log file', type=str)
+
+    # a call without command, e.g. `lcps_batch.py path`, runs a batch job
+    argv = sys.argv[1:]
+    if argv[:1] not in (['batch'], ['sweep'], ['merge'], ['-h'], ['--help']):
+        argv = ['batch'] + argv
+    args = parser.parse_args(argv)
+
+    if args.command == 'batch':
+        batchjob(args.path, args.logfile, args.winSize, args.stepSize,\
+            args.Nneighb, args.minDur, args.maxDur, args.detectionThresh,\
+            args.workers, args.cache_dir, args.cache_size, args.prefetch,\
+            args.sync_every, args.resume, args.shard, args.nshards,\
+            args.baseline_cache, args.baseline_cache_size, args.baseline)
+    elif args.command == 'sweep':
+        configurations = slidingWindow.grid(winSize=args.winSize,\
+            stepSize=args.stepSize, Nneighb=args.Nneighb, minDur=args.minDur,\
+            maxDur=args.maxDur, detectionThresh=args.detectionThresh)
+        sweepjob(args.path, configurations, args.logfile, args.workers,\
+            args.cache_dir, args.cache_size, args.prefetch, 50,\
+            args.baseline_cache, args.baseline_cache_size)
+    else:
+        merge(args.logfiles, args.logfile)
 
     
 #### DEBUGGING 
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+""" On-disk caches for light curves and their local medians.
+
+Contains a cache that stores the cleaned photometry of light curve files in
+a compact binary format, so that repeated batch runs over the same files do
+not need to parse FITS or ascii files again, and a cache of the local median
+and MAD profiles of light curves, so that runs that only change thresholds
+or dip durations do not need to compute them again.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+from astropy.table import Table
+
+
+class _DiskCache(object):
+    """ Directory of .npy entries whose total size is limited by deleting the
+    least recently used ones.
+
+    Parameters
+    ----------
+    cacheDir : str
+        directory that holds the cache entries
+    maxSize : float
+        maximum size of the cache in MB
+    """
+    def __init__(self, cacheDir, maxSize=2048.):
+        self.cacheDir = cacheDir
+        self.maxSize = maxSize*1024**2
+        self._size = None
+        try:
+            os.makedirs(cacheDir)
+        except OSError:
+            if not os.path.isdir(cacheDir):
+                raise
+
+    def _entry(self, key):
+        return os.path.join(self.cacheDir, key + '.npy')
+
+    def _read(self, entry):
+        """ Memory-map a cache entry and mark it as recently used; raises
+        IOError, OSError or ValueError if it cannot be read."""
+        array = np.load(entry, mmap_mode='r')
+        os.utime(entry, None)
+        return array
+
+    def _write(self, entry, array):
+        """ Write an array to the cache and evict old entries."""
+        # write to a temporary file first, so that concurrent processes never
+        # read incomplete entries
+        handle, tmpfile = tempfile.mkstemp(dir=self.cacheDir, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as f:
+            np.save(f, array)
+        os.rename(tmpfile, entry)
+
+        if self._size is None:
+            self._size = self._usage()[0]
+        else:
+            self._size += os.path.getsize(entry)
+        if self._size > self.maxSize:
+            self.evict()
+
+    def _usage(self):
+        """ Total size and (mtime, size, path) of all cache entries."""
+        entries = []
+        for name in os.listdir(self.cacheDir):
+            if name.endswith('.npy'):
+                path = os.path.join(self.cacheDir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return sum(entry[1] for entry in entries), entries
+
+    def evict(self):
+        """ Delete the least recently used entries until the cache fits into
+        `maxSize`."""
+        size, entries = self._usage()
+        for mtime, entrySize, path in sorted(entries):
+            if size <= self.maxSize:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= entrySize
+        self._size = size
+
+
+class LightCurveCache(_DiskCache):
+    """ Size-limited on-disk cache of light curves.
+
+    Each cached light curve is a single .npy file that holds all columns of
+    its photometry table as one record and is loaded with a single memory map.
+    Entries are keyed by the absolute path, size and modification time of the
+    source file as well as the name of the loader, so that modified files are
+    read again. When the cache grows beyond `maxSize`, the least recently used
+    entries are deleted.
+
+    Parameters
+    ----------
+    cacheDir : str
+        directory that holds the cached light curves
+    maxSize : float
+        maximum size of the cache in MB
+
+    Example
+    -------
+    >>> import shutil, tempfile
+    >>> from lcps_io import open_k2sff
+    >>> cacheDir = tempfile.mkdtemp()
+    >>> cache = LightCurveCache(cacheDir)
+    >>> EPICno, photometry = cache.load('tests/220132548', open_k2sff)
+    >>> EPICno, cached = cache.load('tests/220132548', open_k2sff)
+    >>> EPICno, all(cached['FLUX'] == photometry['FLUX'])
+    ('220132548', True)
+    >>> shutil.rmtree(cacheDir)
+    """
+    def key(self, filename, loader):
+        """ Identify a light curve file read by `loader`."""
+        stat = os.stat(filename)
+        identity = '{}|{}|{!r}|{}'.format(os.path.abspath(filename),
+            stat.st_size, stat.st_mtime, loader.__name__)
+        return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+    def load(self, filename, loader):
+        """ Return the photometry of a light curve file from the cache, or read
+        it with `loader` and cache it.
+
+        Parameters
+        ----------
+        filename : str
+            light curve file
+        loader : function
+            function that returns the object identifier and photometry table of
+            a light curve file, e.g. `lcps_io.open_fits`
+
+        Returns
+        -------
+        EPICno : int or str
+            identifier of the object as returned by `loader`
+        photometry : Astropy table
+            photometry as returned by `loader`; columns of cached light curves
+            are read-only memory maps
+        """
+        entry = self._entry(self.key(filename, loader))
+        try:
+            record = self._read(entry)
+        except (IOError, OSError, ValueError):
+            EPICno, photometry = loader(filename)
+            self._store(entry, EPICno, photometry)
+            return EPICno, photometry
+
+        names = [name for name in record.dtype.names if name != 'EPIC']
+        EPICno = json.loads(record['EPIC'][0].decode('utf-8'))
+        if not isinstance(EPICno, int):
+            EPICno = str(EPICno)
+        photometry = Table([record[name][0] for name in names], names=names,
+            copy=False)
+        return EPICno, photometry
+
+    def _store(self, entry, EPICno, photometry):
+        """ Write a light curve to the cache and evict old entries."""
+        columns = [np.asarray(photometry[name]) for name in photometry.colnames]
+        if not all(np.issubdtype(column.dtype, np.number) for column in columns):
+            return
+        EPIC = json.dumps(EPICno).encode('utf-8')
+        recordType = [(str(name), column.dtype.newbyteorder('='), column.shape)
+            for name, column in zip(photometry.colnames, columns)]
+        recordType.append(('EPIC', 'S{}'.format(len(EPIC))))
+        record = np.empty(1, dtype=recordType)
+        for name, column in zip(photometry.colnames, columns):
+            record[name][0] = column
+        record['EPIC'] = EPIC
+        self._write(entry, record)
+
+
+class BaselineCache(_DiskCache):
+    """ Size-limited on-disk cache of local median and MAD profiles.
+
+    The local medians and MADs of a light curve only depend on its fluxes and
+    on `winSize`, `stepSize` and `Nneighb`, so they can be reused by searches
+    with other thresholds or dip durations. Entries are keyed by a hash of
+    the fluxes and these parameters. When the cache grows beyond `maxSize`,
+    the least recently used entries are deleted.
+
+    Parameters
+    ----------
+    cacheDir : str
+        directory that holds the cached profiles
+    maxSize : float
+        maximum size of the cache in MB
+
+    Example
+    -------
+    >>> import shutil, tempfile
+    >>> from slidingWindow import windowedMedian
+    >>> cacheDir = tempfile.mkdtemp()
+    >>> cache = BaselineCache(cacheDir)
+    >>> flux = np.random.normal(1., 0.01, 1000)
+    >>> localMedians, localMADs = cache.load(flux, 10, 1, 1, windowedMedian)
+    >>> cached = cache.load(flux, 10, 1, 1, None)
+    >>> all(cached[0] == localMedians), all(cached[1] == localMADs)
+    (True, True)
+    >>> shutil.rmtree(cacheDir)
+    """
+    def key(self, flux, winSize, stepSize, Nneighb, kind='median'):
+        """ Identify the profile of `flux` for the given parameters."""
+        flux = np.ascontiguousarray(flux)
+        identity = hashlib.sha1(flux.view(np.uint8))
+        identity.update('|{}|{}|{}|{}|{}'.format(flux.dtype.str, winSize,
+            stepSize, Nneighb, kind).encode('utf-8'))
+        return identity.hexdigest()
+
+    def load(self, flux, winSize, stepSize, Nneighb, baseline, kind='median'):
+        """ Return the local median and MAD profile of `flux` from the cache,
+        or compute it with `baseline` and cache it.
+
+        Parameters
+        ----------
+        flux : narray
+            fluxes of a light curve
+        winSize, stepSize, Nneighb
+            parameters of the sliding window (see `slidingWindow.dipsearch`)
+        baseline : function
+            function that returns the local medians and MADs of all window
+            positions, e.g. `slidingWindow.windowedMedian`
+        kind : str
+            name of the kind of profile that `baseline` computes
+
+        Returns
+        -------
+        localMedian : narray
+            local median of each window position (read-only if cached)
+        MAD : narray
+            median absolute deviation of each window position
+        """
+        entry = self._entry(self.key(flux, winSize, stepSize, Nneighb, kind))
+        try:
+            profile = self._read(entry)
+            return profile[0], profile[1]
+        except (IOError, OSError, ValueError):
+            pass
+        localMedian, MAD = baseline(flux, winSize, stepSize, Nneighb)
+        self._write(entry, np.array([localMedian, MAD]))
+        return localMedian, MAD
@@ -5,6 +5,7 @@ Contains functions to extract Kepler PDCSAP and user-provided K2SFF light
 curves.
 """
 
+import re
 import numpy as np
 from astropy.table import Table
 from astropy.io import fits, ascii
@@ -12,6 +13,77 @@ import warnings
 from astropy.utils.exceptions import AstropyUserWarning
 
 
+def read_fits(filename, dtype=np.float64, chunkSize=2**16):
+    """ Read the PDCSAP light curve of a Kepler FITS file into plain arrays.
+    
+    read_fits memory-maps the rows of the light curve table in chunks of
+    `chunkSize` and copies only the TIME, PDCSAP_FLUX and PDCSAP_FLUX_ERR
+    columns into the returned arrays, skipping NaN fluxes in the same step.
+    Each chunk is unmapped right after, so that the memory use is dominated by
+    the returned arrays. The EPIC number is taken from the extension header
+    without decoding the table.
+    
+    Parameters
+    ----------
+    filename : str
+        file name of the FITS file containing the light curve data
+    dtype : numpy dtype
+        floating point type of the returned arrays (e.g. np.float32). If None,
+        the precision of the FITS columns is kept.
+    chunkSize : int
+        number of table rows that are mapped at a time
+        
+    Returns
+    -------
+    EPICno : int
+        EPIC number ('KEPLERID' in the hdu header)
+    time : narray
+        time in BJD - 2454833
+    flux : narray
+        PDCSAP flux
+    flux_err : narray
+        PDCSAP flux error
+        
+    Example
+    -------
+    >>> filename = 'tests/ktwo205919993-c03_llc.fits'
+    >>> EPICno, time, flux, flux_err = read_fits(filename)
+    >>> EPICno, len(time), flux.dtype
+    (205919993, 3133, dtype('float64'))
+    """
+    names = ('TIME', 'PDCSAP_FLUX', 'PDCSAP_FLUX_ERR')
+    with fits.open(filename, memmap=True) as hdulist:
+        hdu = hdulist[1]
+        EPICno = hdu.header['KEPLERID']
+        Nrows = hdu.header['NAXIS2']
+        dataOffset = hdulist.fileinfo(1)['datLoc']
+        # FITS tables are stored big-endian
+        rowType = hdu.columns.dtype.newbyteorder('>')
+        scaled = [column.name for column in hdu.columns if column.name in names
+            and (column.bscale is not None or column.bzero is not None)]
+    if scaled:
+        raise IOError('scaled light curve columns are not supported')
+    
+    columns = [np.empty(Nrows, rowType[name].newbyteorder('=') if dtype is None
+        else dtype) for name in names]
+    N = 0
+    for iRow in xrange(0, Nrows, chunkSize):
+        rows = np.memmap(filename, dtype=rowType, mode='r',
+            offset=dataOffset + iRow*rowType.itemsize,
+            shape=(min(chunkSize, Nrows - iRow),))
+        
+        # remove nans
+        valid = ~np.isnan(rows['PDCSAP_FLUX'])
+        Nvalid = np.count_nonzero(valid)
+        for column, name in zip(columns, names):
+            column[N:N + Nvalid] = rows[name][valid]
+        N += Nvalid
+        del rows
+    for column in columns:
+        column.resize(N, refcheck=False)
+    return (EPICno,) + tuple(columns)
+
+
 def open_fits(filename):
     """ Open a light curve file in the usual Kepler FITS format and extract
     the PDCSAP light curve.
@@ -34,22 +106,12 @@ def open_fits(filename):
     >>> EPICno, photometry = open_fits(filename)
     """
     try:
-        hdulist = fits.open(filename)
+        EPICno, time, flux, flux_err = read_fits(filename, dtype=None)
     except IOError:
         warnings.warn("Could not open FITS file.", AstropyUserWarning)       
         return None  
-    EPICno = hdulist[1].header['KEPLERID']
-    tbdata = hdulist[1].data
-    hdulist.close()
-
-    # extract light curve data from hdu
-    time = tbdata['TIME']
-    flux = tbdata['PDCSAP_FLUX']
-    flux_err = tbdata['PDCSAP_FLUX_ERR']
-    photometry = Table([time, flux, flux_err], names = ('TIME', 'FLUX','FLUX_ERR'))
-    
-    # remove nans
-    photometry = photometry[~np.isnan(photometry['FLUX'])]
+    photometry = Table([time, flux, flux_err], names = ('TIME', 'FLUX','FLUX_ERR'),
+        copy=False)
     return EPICno, photometry
 
 def open_csv(filename):
@@ -92,20 +154,62 @@ def open_k2sff(filename):
     -------
     >>> filename = 'tests/220132548'
     >>> filename, photometry = open_k2sff(filename)
+    >>> len(photometry), photometry['FLUX'][0]
+    (3449, 0.949562432)
+    >>> import os, tempfile
+    >>> f = tempfile.NamedTemporaryFile('w', delete=False)
+    >>> with f:
+    ...     f.write('BJD,Flux\\n1.0,0.99,,\\n2.0,0.98\\n3.0,0.97,\\n')
+    >>> list(open_k2sff(f.name)[1]['FLUX'])
+    [0.99, 0.98, 0.97]
+    >>> os.remove(f.name)
     """
-    with open(filename, 'r') as infile:
-        lines = infile.readlines() 
-        phot = np.zeros([len(lines) - 1, 2])
-        for i, line in enumerate(lines[1:]):
-            # strip trailing comma and '\n' and save to a table
-            line = line.rstrip(',\n')
-            line = line.split(',')
-            phot[i][:] = line
-        photometry = Table(phot, names = ('TIME', 'FLUX'))    
+    with open(filename, 'rb') as infile:
+        infile.readline()
+        data = infile.read()
+    
+    # strip trailing commas and parse all lines at once as a single
+    # comma-separated sequence of numbers
+    data = re.sub(b',+\n', b'\n', data.replace(b'\r', b'')).strip(b', \n')
+    data = data.replace(b'\n', b',')
+    phot = np.fromstring(data, sep=',')
+    if data and len(phot) != data.count(b',') + 1:
+        raise ValueError('could not convert data of "{}" to float'.format(
+            filename))
+    if len(phot) % 2:
+        raise ValueError('"{}" does not contain two columns'.format(filename))
+    phot = phot.reshape(-1, 2)
     
-    # remove nans
-    photometry = photometry[~np.isnan(photometry['FLUX'])]   
+    # remove nans before building the table
+    phot = phot[~np.isnan(phot[:, 1])]
+    photometry = Table(phot, names = ('TIME', 'FLUX'))
     return filename.split('/')[-1], photometry
+
+
+def open_lightcurve(filename):
+    """ Extract the photometry of a light curve file according to its type.
+    
+    Files ending in 'fits' are opened with `open_fits`, files ending in 'csv'
+    with `open_csv` and all other files with `open_k2sff`.
+    
+    Parameters
+    ----------
+    filename : str
+        file name of the light curve
+    
+    Returns
+    -------
+    EPICno : int or str
+        EPIC number or file name that identifies the object
+    photometry : Astropy table
+        Columns contain time, flux (and flux error)
+    """
+    if filename.endswith('fits'):
+        return open_fits(filename)
+    elif filename.endswith('csv'):
+        return open_csv(filename)
+    else:
+        return open_k2sff(filename)
     
 if __name__ == "__main__":
     import doctest
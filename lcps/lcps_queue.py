@@ -0,0 +1,482 @@
+# -*- coding: utf-8 -*-
+""" Work queue for batch jobs of independent worker processes.
+
+This module contains a file-backed queue of light curves that are scanned by
+any number of worker processes, possibly on several machines that share a
+file system. The queue is a directory with an SQLite database of the targets
+and the result streams of the workers. It includes an argument parser to
+fill the queue, run workers and collect the results from the shell.
+"""
+
+import os
+import json
+import time
+import itertools
+import uuid
+import socket
+import sqlite3
+import warnings
+from astropy import log
+import slidingWindow
+import lcps_batch
+from lcps_batch import DipWriter, Journal
+
+
+class WorkQueue(object):
+    """ Queue of light curves in an SQLite database.
+
+    Workers claim targets for the duration of a lease. Targets whose lease
+    expires before the worker completes them, e.g. because the worker
+    crashed, are issued again. Only the first completion of a target by the
+    worker that holds its lease is accepted.
+
+    Parameters
+    ----------
+    queueDir : str
+        directory of the queue, created by `fill`
+
+    Example
+    -------
+    >>> import shutil, tempfile
+    >>> queueDir = tempfile.mkdtemp()
+    >>> queue = fill('tests/', queueDir)
+    >>> claimed = queue.claim('worker0', 1, lease=60.)
+    >>> [file for id, file in claimed]
+    ['ktwo205919993-c03_llc.fits']
+    >>> queue.complete('worker0', [(claimed[0][0], 11, None)])
+    1
+    >>> queue.counts()
+    {'done': 1, 'pending': 1}
+    >>> queue.close()
+    >>> shutil.rmtree(queueDir)
+    """
+    def __init__(self, queueDir):
+        self.queueDir = queueDir
+        self.database = os.path.join(queueDir, 'queue.sqlite')
+        if not os.path.isfile(self.database):
+            raise IOError('"{}" is not a work queue'.format(queueDir))
+        self._db = _connect(self.database)
+        params = dict(self._db.execute('SELECT name, value FROM params'))
+        self.path = json.loads(params['path'])
+        self.params = tuple(json.loads(params['params']))
+        # queues filled before baselines were selectable use the median
+        if len(self.params) == 6:
+            self.params += ('median',)
+
+    @property
+    def resultDir(self):
+        """ Directory of the result streams of the workers."""
+        return os.path.join(self.queueDir, 'results')
+
+    def claim(self, worker, N=1, lease=600.):
+        """ Claim up to `N` pending targets (largest first) for `lease`
+        seconds and return them as a list of (id, file)."""
+        now = time.time()
+        with _transaction(self._db):
+            claimed = self._db.execute("SELECT id, file FROM targets WHERE "
+                "state = 'pending' OR (state = 'claimed' AND expires < ?) "
+                "ORDER BY size DESC, id LIMIT ?", (now, N)).fetchall()
+            self._db.executemany("UPDATE targets SET state = 'claimed', "
+                "worker = ?, expires = ? WHERE id = ?",
+                [(worker, now + lease, id) for id, file in claimed])
+        return [(id, str(file)) for id, file in claimed]
+
+    def renew(self, worker, ids, lease=600.):
+        """ Extend the leases of targets that `worker` holds."""
+        with _transaction(self._db):
+            self._db.executemany("UPDATE targets SET expires = ? WHERE id = ? "
+                "AND state = 'claimed' AND worker = ?",
+                [(time.time() + lease, id, worker) for id in ids])
+
+    def complete(self, worker, results):
+        """ Mark targets as done.
+
+        Parameters
+        ----------
+        worker : str
+            name of the worker
+        results : list
+            (id, number of dips, error message or None) of scanned targets
+
+        Returns
+        -------
+        N : int
+            number of results that were accepted
+        """
+        with _transaction(self._db):
+            N = 0
+            for id, ndips, error in results:
+                N += self._db.execute('UPDATE targets SET state = ?, ndips = ?, '
+                    "error = ? WHERE id = ? AND state = 'claimed' AND worker = ?",
+                    ('error' if error else 'done', ndips, error, id,
+                    worker)).rowcount
+        return N
+
+    def counts(self):
+        """ Number of targets per state ('pending', 'claimed', 'done' or
+        'error')."""
+        return dict((str(state), N) for state, N in self._db.execute(
+            'SELECT state, COUNT(*) FROM targets GROUP BY state'))
+
+    def next_expiry(self):
+        """ Time when the next lease expires, or None if no target is
+        claimed."""
+        return self._db.execute("SELECT MIN(expires) FROM targets WHERE "
+            "state = 'claimed'").fetchone()[0]
+
+    def targets(self, state=None):
+        """ (id, file, worker, ndips, error) of all targets (in a given state)
+        in the order of the file list."""
+        query = 'SELECT id, file, worker, ndips, error FROM targets'
+        args = ()
+        if state is not None:
+            query += ' WHERE state = ?'
+            args = (state,)
+        return [(id, str(file), worker and str(worker), ndips, error) for
+            id, file, worker, ndips, error in
+            self._db.execute(query + ' ORDER BY id', args)]
+
+    def close(self):
+        self._db.close()
+
+
+def _connect(database):
+    """ Open an SQLite database whose transactions are managed explicitly."""
+    return sqlite3.connect(database, timeout=600., isolation_level=None)
+
+
+class _transaction(object):
+    """ Context of a write transaction that locks the database right away."""
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+
+    def __exit__(self, excType, exc, traceback):
+        self.db.execute('COMMIT' if excType is None else 'ROLLBACK')
+
+
+def _trimStream(stream, header):
+    """ Cut the result stream of a worker and its journal back to the
+    journal entries whose dips were all written, dropping the incomplete
+    rows and entries of an interrupted run, so that a restarted worker can
+    append to them."""
+    with open(stream, 'rb') as f:
+        content = f.read()
+    if not content.startswith(header):
+        raise ValueError('the parameters of "{}" differ from the queue'\
+            .format(stream))
+    rows = content[len(header):].split(b'\n')[:-1]
+    with open(stream + '.journal', 'rb') as f:
+        lines = f.read().split(b'\n')[:-1]
+
+    # byte offsets of the ends of the complete entries and their dips
+    iRow, streamEnd = 0, len(header)
+    journalEnd = len(lines[0]) + 1 if lines else 0
+    for line, (file, size, mtime, ndips, status) in zip(lines[1:],
+            Journal.read(stream + '.journal')):
+        if iRow + ndips > len(rows):
+            break
+        streamEnd += sum(len(row) + 1 for row in rows[iRow:iRow + ndips])
+        journalEnd += len(line) + 1
+        iRow += ndips
+    for filename, end in ((stream, streamEnd), (stream + '.journal',
+            journalEnd)):
+        with open(filename, 'r+b') as f:
+            f.truncate(end)
+
+
+def fill(path, queueDir, winSize=10, stepSize=1, Nneighb=1, minDur=2,
+        maxDur=5, detectionThresh=0.995, baseline='median'):
+    """ Create a work queue of all light curves in a folder or archive.
+
+    Parameters
+    ----------
+    path : str
+        folder which contains the light curve files, or a light curve archive
+        written by `lcps_archive.pack`
+    queueDir : str
+        new directory of the queue
+    winSize, stepSize, Nneighb, minDur, maxDur, detectionThresh, baseline
+        parameters of the dip search (see `lcps_batch.batchjob`) that all
+        workers use
+
+    Returns
+    -------
+    queue : `WorkQueue`
+        the filled queue
+    """
+    slidingWindow._checkParameters(winSize, minDur, maxDur)
+    if baseline not in ('median', 'mean', 'clipped-mean', 'sketch'):
+        raise ValueError('unknown baseline "{}"'.format(baseline))
+    archive, filelist, targets, identities = lcps_batch._listTargets(path)
+    os.makedirs(os.path.join(queueDir, 'results'))
+    db = _connect(os.path.join(queueDir, 'queue.sqlite'))
+    with _transaction(db):
+        db.execute('CREATE TABLE params (name TEXT PRIMARY KEY, value TEXT)')
+        db.execute("CREATE TABLE targets (id INTEGER PRIMARY KEY, file TEXT, "
+            "size INTEGER, mtime REAL, state TEXT DEFAULT 'pending', "
+            "worker TEXT, expires REAL, ndips INTEGER, error TEXT)")
+        db.execute('CREATE INDEX targets_state ON targets (state, size)')
+        db.executemany('INSERT INTO params VALUES (?, ?)', [
+            ('path', json.dumps(path)),
+            ('params', json.dumps([winSize, stepSize, Nneighb, minDur, maxDur,
+            detectionThresh, baseline]))])
+        db.executemany('INSERT INTO targets (id, file, size, mtime) VALUES '
+            '(?, ?, ?, ?)', [(i, file, size, mtime) for i, (file, (size, mtime))
+            in enumerate(zip(filelist, identities))])
+    db.close()
+    return WorkQueue(queueDir)
+
+
+def work(queueDir, worker=None, batch=8, lease=600., cacheDir=None,
+        cacheSize=2048., prefetch=4, poll=10., baselineDir=None,
+        baselineSize=2048.):
+    """ Scan the targets of a work queue until all of them are done.
+
+    The worker claims `batch` targets at a time and appends their dips and
+    journal entries to its own result stream in the `results` directory of
+    the queue. The stream is synced to disk before the targets are marked as
+    done. When no target can be claimed, the worker waits for the leases of
+    other workers to expire, and stops when all targets are done. A worker
+    that is restarted with the same name, e.g. after a crash, keeps the
+    results in its stream and appends to it.
+
+    Parameters
+    ----------
+    queueDir : str
+        directory of the queue
+    worker : str
+        unique name of the worker (Default: host name, process ID and a
+        random suffix)
+    batch : int
+        number of targets claimed at a time
+    lease : float
+        time in seconds after which targets of the worker are issued to other
+        workers. The lease of each claimed target is renewed whenever the
+        worker completes one of them.
+    cacheDir, cacheSize, prefetch
+        see `lcps_batch.batchjob`
+    poll : float
+        maximum time in seconds between two attempts to claim targets
+    baselineDir, baselineSize
+        see `lcps_batch.batchjob`
+
+    Returns
+    -------
+    N : int
+        number of targets that the worker completed
+    """
+    if worker is None:
+        worker = '{}-{}-{}'.format(socket.gethostname(), os.getpid(),
+            uuid.uuid4().hex[:8])
+    queue = WorkQueue(queueDir)
+    archive = queue.path if os.path.isfile(queue.path) else None
+    lcps_batch._initWorker(cacheDir, cacheSize, archive, baselineDir,
+        baselineSize)
+    stream = os.path.join(queue.resultDir, worker + '.log')
+    restart = os.path.isfile(stream) and os.path.isfile(stream + '.journal')
+    if restart:
+        _trimStream(stream, lcps_batch._logHeader(*queue.params))
+    writer = DipWriter(stream, *queue.params, syncEvery=batch, append=restart)
+    journal = Journal(stream + '.journal', syncEvery=batch, append=restart)
+
+    Ncompleted = 0
+    while True:
+        claimed = queue.claim(worker, batch, lease)
+        if not claimed:
+            counts = queue.counts()
+            if not counts.get('pending') and not counts.get('claimed'):
+                break
+            expiry = queue.next_expiry()
+            time.sleep(min(poll, max(0., expiry - time.time()) if expiry
+                else poll))
+            continue
+
+        if archive is None:
+            targets = [queue.path + file for id, file in claimed]
+        else:
+            targets = [id for id, file in claimed]
+        if prefetch > 0:
+            lightcurves = lcps_batch._prefetch(lcps_batch._loadTarget, targets,
+                prefetch)
+        else:
+            lightcurves = (lcps_batch._loadTarget(target) for target in targets)
+        # the journal of a stream only locates the dips of each target, file
+        # sizes and times are kept in the queue
+        results = []
+        for i, lightcurve in enumerate(lightcurves):
+            id, file = claimed[i]
+            EPICno, dips, error = lcps_batch._searchTarget(lightcurve,
+                queue.params)
+            if error:
+                warnings.warn('Cannot scan the file "{}" ({})'.format(file,
+                    error))
+                journal.append(file, 0, 0., 0, 'error')
+                results.append((id, 0, error))
+            else:
+                log.info('Scanning target {}: EPIC {}'.format(file, EPICno))
+                writer.write(dips)
+                journal.append(file, 0, 0., len(dips))
+                results.append((id, len(dips), None))
+            queue.renew(worker, [id for id, file in claimed[i + 1:]], lease)
+
+        # results are durable before they are reported
+        writer.sync()
+        journal.sync()
+        Ncompleted += queue.complete(worker, results)
+
+    writer.close()
+    journal.close()
+    queue.close()
+    return Ncompleted
+
+
+def finalize(queueDir, logfile):
+    """ Collect the result streams of all workers into one dip log.
+
+    Only the dips of the completions that the queue accepted are kept, so
+    targets that were scanned by several workers appear once. The dips are
+    written in the order of the file list, like by `lcps_batch.batchjob`.
+
+    Parameters
+    ----------
+    queueDir : str
+        directory of the queue
+    logfile : str
+        output file for dips
+
+    Returns
+    -------
+    N : int
+        number of dips in the log
+    """
+    queue = WorkQueue(queueDir)
+    accepted = dict((file, worker) for id, file, worker, ndips, error in
+        queue.targets('done'))
+    header = lcps_batch._logHeader(*queue.params)
+    rows = {}
+    for name in sorted(os.listdir(queue.resultDir)):
+        if not name.endswith('.log'):
+            continue
+        stream = os.path.join(queue.resultDir, name)
+        worker = name[:-len('.log')]
+        streamHeader, streamRows = lcps_batch._readLog(stream)
+        if streamHeader != header:
+            raise ValueError('the parameters of "{}" differ from the queue'\
+                .format(stream))
+        for file, size, mtime, ndips, status in Journal.read(stream +
+                '.journal'):
+            dips = list(itertools.islice(streamRows, ndips))
+            if len(dips) < ndips:
+                raise ValueError('"{}" lacks dips of its journal'.format(
+                    stream))
+            if accepted.get(file) == worker and file not in rows:
+                rows[file] = dips
+
+    for id, file, worker, ndips, error in queue.targets('error'):
+        warnings.warn('Cannot scan the file "{}" ({})'.format(file, error))
+    counts = queue.counts()
+    unfinished = counts.get('pending', 0) + counts.get('claimed', 0)
+    if unfinished:
+        warnings.warn('{} targets of the queue are not done yet'.format(
+            unfinished))
+
+    missing = [(file, worker) for id, file, worker, ndips, error in
+        queue.targets('done') if file not in rows]
+    if missing:
+        raise ValueError('the results of {} done targets are missing from '
+            'the streams of their workers, e.g. "{}" of worker "{}"'.format(
+            len(missing), *missing[0]))
+
+    N, EPICs = 0, set()
+    with open(logfile, 'w') as f:
+        f.write(header)
+        for id, file, worker, ndips, error in queue.targets('done'):
+            f.write(''.join(rows[file]))
+            N += len(rows[file])
+            EPICs.update(row.split(',')[0] for row in rows[file])
+    queue.close()
+    log.info('{} dips found in {} light curves.'.format(N, len(EPICs)))
+    return N
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+
+    # parse parameters
+    import argparse
+    parser = argparse.ArgumentParser(\
+        description='scan light curves with independent worker processes')
+    commands = parser.add_subparsers(dest='command')
+
+    fillParser = commands.add_parser('fill',\
+        help='create a queue of all light curves in a folder or archive')
+    fillParser.add_argument('path',\
+        help='path containing light curve (FITS or ascii) files, or a light curve archive',\
+        type=str)
+    fillParser.add_argument('queue',\
+        help='new directory of the queue', type=str)
+    fillParser.add_argument('--winSize', default=50,\
+        help='Size of a sliding window', type=int)
+    fillParser.add_argument('--stepSize', default=10,\
+        help='steps per slide (Default = 1, i.e. slide one data point per iteration)', type=int)
+    fillParser.add_argument('--Nneighb', default=1,\
+        help='Number of neighboring windows to be considered for the local median', type=int)
+    fillParser.add_argument('--minDur', default=2,\
+        help='minimum dip duration in # of data points', type=int)
+    fillParser.add_argument('--maxDur', default=49,\
+        help='maximum dip duration in # of data points', type=int)
+    fillParser.add_argument('--detectionThresh', default=0.98,\
+        help='fraction of flux below which a dip is registered', type=float)
+    fillParser.add_argument('--baseline', default='median',\
+        choices=('median', 'mean', 'clipped-mean', 'sketch'),\
+        help='local flux level that dips are compared with', type=str)
+
+    workParser = commands.add_parser('work',\
+        help='scan targets of a queue until all of them are done')
+    workParser.add_argument('queue',\
+        help='directory of the queue', type=str)
+    workParser.add_argument('--worker', default=None,\
+        help='unique name of the worker', type=str)
+    workParser.add_argument('--batch', default=8,\
+        help='number of targets claimed at a time', type=int)
+    workParser.add_argument('--lease', default=600.,\
+        help='time in seconds after which unfinished targets are issued again', type=float)
+    workParser.add_argument('--cache-dir', default=None,\
+        help='directory of a cache for the photometry of scanned files', type=str)
+    workParser.add_argument('--cache-size', default=2048.,\
+        help='maximum size of the light curve cache in MB', type=float)
+    workParser.add_argument('--prefetch', default=4,\
+        help='number of light curves read ahead', type=int)
+    workParser.add_argument('--baseline-cache', default=None,\
+        help='directory of a cache for the local medians of scanned light curves', type=str)
+    workParser.add_argument('--baseline-cache-size', default=2048.,\
+        help='maximum size of the baseline cache in MB', type=float)
+
+    finalizeParser = commands.add_parser('finalize',\
+        help='collect the results of all workers into one log file')
+    finalizeParser.add_argument('queue',\
+        help='directory of the queue', type=str)
+    finalizeParser.add_argument('--logfile', default='./dips.log',\
+        help='name of log file that will contain dips', type=str)
+
+    statusParser = commands.add_parser('status',\
+        help='show the number of targets per state')
+    statusParser.add_argument('queue',\
+        help='directory of the queue', type=str)
+    args = parser.parse_args()
+
+    if args.command == 'fill':
+        fill(args.path, args.queue, args.winSize, args.stepSize, args.Nneighb,\
+            args.minDur, args.maxDur, args.detectionThresh, args.baseline)
+    elif args.command == 'work':
+        work(args.queue, args.worker, args.batch, args.lease, args.cache_dir,\
+            args.cache_size, args.prefetch, baselineDir=args.baseline_cache,\
+            baselineSize=args.baseline_cache_size)
+    elif args.command == 'finalize':
+        finalize(args.queue, args.logfile)
+    else:
+        print(WorkQueue(args.queue).counts())
@@ -5,14 +5,31 @@ This module contains the dip search routine that is based on a "sliding window"
 technique, as well as additional helper functions. 
 """
 
+import inspect
+import itertools
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from bisect import bisect_left, insort
+from multiprocessing.pool import ThreadPool
 from astropy.table import Table
 
-def get_localMedian(flux, iWinStart, winSize, Nneighb=1):
+def _neighborhood(iWinStart, winSize, Nneighb, Ndata):
+    """ Index ranges of the neighborhood of a window (see `get_localMedian`)."""
+    # At the boundaries, expand neighborhood towards center
+    if (iWinStart < winSize) or (iWinStart > Ndata - winSize):
+        Nneighb *= 2
+    iMin = max(0, iWinStart - Nneighb*winSize)
+    iMax = min(Ndata, iWinStart + (1 + Nneighb)*winSize)
+    return (iMin, iWinStart), (iWinStart + winSize, iMax)
+
+
+def get_localMedian(flux, iWinStart, winSize, Nneighb=1, rankError=None):
     """ Find the local median and MAD of fluxes, ignoring the current window.
     
     get_localMedian computes the median flux and the median absolute deviation
     (MAD) in the neighboring windows. The flux in the current window is ignored.
+    With `rankError`, both are estimated from quantile sketches like by
+    `sketchedMedian`.
     
     Parameters
     ----------
@@ -26,6 +43,9 @@ def get_localMedian(flux, iWinStart, winSize, Nneighb=1):
         Number of neighboring windows to be considered for the averaging (At
         the boundaries of the time series, the considered data extends to the
         beginning or end of the array, respectively)
+    rankError : float
+        maximum rank error of an estimated median as a fraction of the
+        neighborhood (Default: exact median)
     
     Returns
     -------
@@ -40,16 +60,18 @@ def get_localMedian(flux, iWinStart, winSize, Nneighb=1):
     >>> get_localMedian(flux, 4, 4, Nneighb=1)
     (1.0, 0.010000000000000009)
     """
+    if rankError is not None:
+        flux = np.asarray(flux)
+        if not np.issubdtype(flux.dtype, np.floating):
+            flux = flux.astype(float)
+        localMedian, MAD = _sketchedBlock(flux, np.array([iWinStart]),
+            winSize, 1, Nneighb, rankError)
+        return localMedian[0], MAD[0]
     
-    # At the boundaries, expand neighborhood towards center
-    if (iWinStart < winSize) or (iWinStart > len(flux) - winSize):
-        Nneighb *= 2
-
     # construct neighborhood without current window        
-    iMin = max(0, iWinStart - Nneighb*winSize)
-    iMax = min(len(flux), iWinStart + (1 + Nneighb)*winSize)
-    neighborhood = np.append(flux[iMin:iWinStart],
-        flux[iWinStart + winSize:iMax])
+    (iMin, iLeft), (iRight, iMax) = _neighborhood(iWinStart, winSize, Nneighb,
+        len(flux))
+    neighborhood = np.append(flux[iMin:iLeft], flux[iRight:iMax])
     
     # compute median and MAD of neighborhood
     localMedian = np.median(neighborhood)
@@ -57,6 +79,165 @@ def get_localMedian(flux, iWinStart, winSize, Nneighb=1):
     return localMedian, MAD
 
 
+def _rangeDifference(ranges, others):
+    """ Yield the indices covered by `ranges` but not by `others`."""
+    for lo, hi in ranges:
+        pieces = [(lo, hi)]
+        for oLo, oHi in others:
+            if oLo >= oHi:
+                continue
+            pieces = [piece for pLo, pHi in pieces
+                for piece in ((pLo, min(pHi, oLo)), (max(pLo, oHi), pHi))
+                if piece[0] < piece[1]]
+        for pLo, pHi in pieces:
+            for i in xrange(pLo, pHi):
+                yield i
+
+
+def _kthDeviation(sortedFlux, iSplit, median, k):
+    """ k-th smallest absolute deviation from `median` in a sorted list.
+
+    The deviations left and right of `iSplit` form two ascending sequences,
+    so the k-th order statistic of their union is found by bisection in
+    O(log W) for a list of W values instead of sorting all deviations.
+    """
+    NLeft = iSplit
+    NRight = len(sortedFlux) - iSplit
+    left = lambda j: median - sortedFlux[iSplit - 1 - j]
+    right = lambda j: sortedFlux[iSplit + j] - median
+
+    # number of deviations taken from the left sequence
+    lo = max(0, k + 1 - NRight)
+    hi = min(k + 1, NLeft)
+    while lo < hi:
+        j = (lo + hi)//2
+        if left(j) < right(k - j):
+            lo = j + 1
+        else:
+            hi = j
+    candidates = []
+    if lo > 0:
+        candidates.append(left(lo - 1))
+    if k + 1 - lo > 0:
+        candidates.append(right(k - lo))
+    return max(candidates)
+
+
+def _sortedMedianMAD(sortedFlux, cast=float):
+    """ Median and MAD of a sorted list, computed like `np.median`.
+    
+    Every arithmetic result is rounded with `cast` to reproduce `np.median` on
+    arrays of that precision (e.g. single precision PDCSAP fluxes).
+    """
+    N = len(sortedFlux)
+    if not N:
+        return np.nan, np.nan
+    if N % 2:
+        median = cast(sortedFlux[N//2])
+    else:
+        median = cast(cast(sortedFlux[N//2 - 1] + sortedFlux[N//2])/2.)
+    iSplit = bisect_left(sortedFlux, median)
+    if N % 2:
+        MAD = cast(_kthDeviation(sortedFlux, iSplit, median, N//2))
+    else:
+        MAD = cast(cast(
+            cast(_kthDeviation(sortedFlux, iSplit, median, N//2 - 1)) +
+            cast(_kthDeviation(sortedFlux, iSplit, median, N//2)))/2.)
+    return median, MAD
+
+
+def rollingMedian(flux, winSize, stepSize=1, Nneighb=1):
+    """ Compute the local median and MAD for every position of a sliding window.
+
+    rollingMedian returns the same sequence of (localMedian, MAD) pairs as
+    calling `get_localMedian` for the window positions 0, `stepSize`,
+    2*`stepSize`, ... < len(flux) - `winSize`, but it keeps the neighborhood of
+    the current window as a sorted list and only inserts and removes the data
+    points that enter or leave it when the window slides. Each insertion and
+    removal shifts the list and costs O(W) for a neighborhood of W data
+    points, while median and MAD are then found in O(log W) by bisection of
+    the sorted neighborhood.
+
+    Parameters
+    ----------
+    flux : narray
+        A numpy array with the flux data. Like with `np.median`, the median
+        and MAD of neighborhoods that contain NaNs are NaN.
+    winSize : int
+        Size of a window
+    stepSize : int
+        steps per slide (Default = 1, i.e. slide one data point per iteration).
+    Nneighb : int
+        Number of neighboring windows per side to be considered for the local
+        median (At the boundaries of the time series, the considered data
+        extends to the beginning or end of the array, respectively)
+
+    Returns
+    -------
+    localMedian : narray
+        Median of the flux in the windows neighboring each window position
+    MAD : narray
+        median absolute deviation of each window's neighborhood
+
+    Example
+    -------
+    >>> flux = np.array([1.00,1.01,0.99,0.80,0.75,0.95,0.99,0.99,1.00,0.80,1.01])
+    >>> localMedian, MAD = rollingMedian(flux, 4, 2, Nneighb=1)
+    >>> localMedian[2], MAD[2]
+    (1.0, 0.010000000000000009)
+    >>> [get_localMedian(flux, i, 4, 1) == (localMedian[j], MAD[j])
+    ...     for j, i in enumerate(range(0, len(flux) - 4, 2))]
+    [True, True, True, True]
+    >>> flux[1] = np.nan
+    >>> localMedian, MAD = rollingMedian(flux, 4, 2, Nneighb=1)
+    >>> np.isnan(localMedian), np.isnan(MAD)
+    (array([False,  True,  True, False]), array([False,  True,  True, False]))
+    """
+    flux = np.asarray(flux)
+    if not np.issubdtype(flux.dtype, np.floating):
+        flux = flux.astype(float)
+    Nwin = len(xrange(0, len(flux) - winSize, stepSize))
+    localMedian = np.empty(Nwin, dtype=flux.dtype.type)
+    MAD = np.empty(Nwin, dtype=flux.dtype.type)
+    for j, (median, deviation) in enumerate(_rollingMedians(flux, winSize,
+            stepSize, Nneighb)):
+        localMedian[j], MAD[j] = median, deviation
+    return localMedian, MAD
+
+
+def _rollingMedians(flux, winSize, stepSize, Nneighb):
+    """ Yield the (localMedian, MAD) pairs of `rollingMedian` one window
+    position after the other."""
+    cast = flux.dtype.type
+    values = flux.tolist()
+    isNaN = np.isnan(flux).tolist()
+    sortedFlux = []
+    NNaN = 0
+    ranges = ()
+    for i in xrange(0, len(values) - winSize, stepSize):
+        newRanges = _neighborhood(i, winSize, Nneighb, len(values))
+
+        # update the sorted neighborhood with data leaving and entering it;
+        # NaNs cannot be sorted, so they are only counted
+        for k in _rangeDifference(ranges, newRanges):
+            if isNaN[k]:
+                NNaN -= 1
+            else:
+                del sortedFlux[bisect_left(sortedFlux, values[k])]
+        for k in _rangeDifference(newRanges, ranges):
+            if isNaN[k]:
+                NNaN += 1
+            else:
+                insort(sortedFlux, values[k])
+        ranges = newRanges
+
+        # NaN like `np.median` if the neighborhood contains a NaN
+        if NNaN:
+            yield cast(np.nan), cast(np.nan)
+        else:
+            yield _sortedMedianMAD(sortedFlux, cast)
+
+
 def findDip(timeWindow, fluxWindow, minDur=1, maxDur=5, localMedian=1.00,
         localMAD=0.01, detectionThresh=0.995):
     """ Search for negative excursions (dips) in an array.
@@ -135,14 +316,1226 @@ def findDip(timeWindow, fluxWindow, minDur=1, maxDur=5, localMedian=1.00,
     return None, None
 
 
+def _windowView(a, winSize, stepSize, Nwin):
+    """ Zero-copy (Nwin, winSize) view of the windows of a sliding window."""
+    a = np.ascontiguousarray(a)
+    stride = a.strides[0]
+    return as_strided(a, shape=(Nwin, winSize),
+        strides=(stepSize*stride, stride), writeable=False)
+
+
+def windowedMedian(flux, winSize, stepSize=1, Nneighb=1, chunkSize=2**20):
+    """ Compute the local median and MAD for every window position at once.
+
+    windowedMedian returns the same arrays as `rollingMedian`. Away from the
+    boundaries of the time series, all neighborhoods have the same size and
+    are assembled from strided views of the flux array, so that their medians
+    are computed in blocks of at most `chunkSize` data points by `np.median`.
+    The remaining windows at the boundaries are handled by `get_localMedian`.
+
+    Parameters
+    ----------
+    flux : narray
+        A numpy array with the flux data
+    winSize : int
+        Size of a window
+    stepSize : int
+        steps per slide (Default = 1, i.e. slide one data point per iteration).
+    Nneighb : int
+        Number of neighboring windows per side to be considered for the local
+        median (At the boundaries of the time series, the considered data
+        extends to the beginning or end of the array, respectively)
+    chunkSize : int
+        Maximum number of neighborhood data points that are held in memory
+
+    Returns
+    -------
+    localMedian : narray
+        Median of the flux in the windows neighboring each window position
+    MAD : narray
+        median absolute deviation of each window's neighborhood
+
+    Example
+    -------
+    >>> flux = np.random.normal(1.0, 0.01, 200)
+    >>> [np.array_equal(a, b) for a, b in zip(windowedMedian(flux, 10, 3, 2),
+    ...     rollingMedian(flux, 10, 3, 2))]
+    [True, True]
+    """
+    flux = np.asarray(flux)
+    if not np.issubdtype(flux.dtype, np.floating):
+        flux = flux.astype(float)
+    starts = np.arange(0, len(flux) - winSize, stepSize)
+    return _blockMedian(flux, starts, winSize, stepSize, Nneighb, len(flux),
+        chunkSize=chunkSize)
+
+
+def _blockMedian(flux, starts, winSize, stepSize, Nneighb, Ndata, offset=0,
+        chunkSize=2**20):
+    """ Local medians and MADs of the windows beginning at the ascending
+    indices `starts` of a light curve of `Ndata` data points, of which `flux`
+    holds those from index `offset` on."""
+    localMedian = np.empty(len(starts), dtype=flux.dtype.type)
+    MAD = np.empty(len(starts), dtype=flux.dtype.type)
+
+    # windows whose neighborhood is neither expanded nor truncated are
+    # computed from strided views, all others like by `get_localMedian`
+    interior = (starts >= max(winSize, Nneighb*winSize)) & \
+        (starts + (1 + Nneighb)*winSize <= Ndata) & (Nneighb > 0)
+    for j in np.flatnonzero(~interior):
+        (iMin, iLeft), (iRight, iMax) = _neighborhood(starts[j], winSize,
+            Nneighb, Ndata)
+        neighborhood = np.append(flux[iMin - offset:iLeft - offset],
+            flux[iRight - offset:iMax - offset])
+        median = np.median(neighborhood)
+        localMedian[j], MAD[j] = median, np.median(abs(neighborhood - median))
+
+    iInterior = np.flatnonzero(interior)
+    if not len(iInterior):
+        return localMedian, MAD
+    jFirst, jLast = iInterior[0], iInterior[-1]
+    if starts[jLast] - starts[jFirst] == (jLast - jFirst)*stepSize:
+        localMedian[jFirst:jLast + 1], MAD[jFirst:jLast + 1] = _interiorMedian(
+            flux, starts[jFirst] - offset, jLast + 1 - jFirst, winSize,
+            stepSize, Nneighb, chunkSize)
+    else:
+        localMedian[jFirst:jLast + 1], MAD[jFirst:jLast + 1] = _gatheredMedian(
+            flux, starts[jFirst:jLast + 1] - offset, winSize, Nneighb,
+            chunkSize)
+    return localMedian, MAD
+
+
+def _interiorMedian(flux, iWinStart, Nwin, winSize, stepSize, Nneighb,
+        chunkSize=2**20):
+    """ Local medians and MADs of `Nwin` consecutive windows starting at
+    index `iWinStart` whose neighborhoods are neither expanded nor truncated,
+    computed from strided views in blocks of at most `chunkSize` points."""
+    localMedian = np.empty(Nwin, dtype=flux.dtype.type)
+    MAD = np.empty(Nwin, dtype=flux.dtype.type)
+    NwinChunk = max(1, chunkSize//(2*Nneighb*winSize))
+    for j in xrange(0, Nwin, NwinChunk):
+        NwinBlock = min(NwinChunk, Nwin - j)
+        iStart = iWinStart + j*stepSize
+        left = _windowView(flux[iStart - Nneighb*winSize:],
+            Nneighb*winSize, stepSize, NwinBlock)
+        right = _windowView(flux[iStart + winSize:],
+            Nneighb*winSize, stepSize, NwinBlock)
+        neighborhood = np.hstack([left, right])
+        median = np.median(neighborhood, axis=1)
+        localMedian[j:j + NwinBlock] = median
+        MAD[j:j + NwinBlock] = np.median(
+            abs(neighborhood - median[:, np.newaxis]), axis=1)
+    return localMedian, MAD
+
+
+def _gatheredMedian(flux, starts, winSize, Nneighb, chunkSize=2**20):
+    """ Local medians and MADs like `_interiorMedian` of windows at arbitrary
+    indices `starts`, whose neighborhoods are gathered by fancy indexing."""
+    localMedian = np.empty(len(starts), dtype=flux.dtype.type)
+    MAD = np.empty(len(starts), dtype=flux.dtype.type)
+    offsets = np.concatenate([np.arange(-Nneighb*winSize, 0),
+        np.arange(winSize, (1 + Nneighb)*winSize)])
+    NwinChunk = max(1, chunkSize//(2*Nneighb*winSize))
+    for j in xrange(0, len(starts), NwinChunk):
+        neighborhood = flux[starts[j:j + NwinChunk, np.newaxis] + offsets]
+        median = np.median(neighborhood, axis=1)
+        localMedian[j:j + NwinChunk] = median
+        MAD[j:j + NwinChunk] = np.median(
+            abs(neighborhood - median[:, np.newaxis]), axis=1)
+    return localMedian, MAD
+
+
+def windowedMean(flux, winSize, stepSize=1, Nneighb=1, Nsigma=None, Niter=3):
+    """ Compute the local mean and scale of the flux for every window position.
+    
+    windowedMean is a fast alternative to `windowedMedian` for quiet light
+    curves. The neighborhoods of the windows are the same, but their mean and
+    standard deviation follow from cumulative sums of the fluxes and their
+    squares, so that each window position costs O(1) regardless of
+    `winSize` and `Nneighb`. The standard deviation is scaled by 0.6745, the
+    ratio of MAD and standard deviation of a normal distribution, so that it
+    takes the place of the MAD in the detection threshold.
+    
+    With `Nsigma`, the mean and standard deviation are sigma-clipped: data
+    points that deviate by more than `Nsigma` standard deviations from the
+    mean of the window position centered closest to them are left out of the
+    sums, and the statistics are computed again, `Niter` times in total.
+    
+    Parameters
+    ----------
+    flux : narray
+        A numpy array with the flux data. NaNs and other non-finite fluxes
+        are left out of the neighborhoods.
+    winSize : int
+        Size of a window
+    stepSize : int
+        steps per slide (Default = 1, i.e. slide one data point per iteration).
+    Nneighb : int
+        Number of neighboring windows per side to be considered for the local
+        mean (At the boundaries of the time series, the considered data
+        extends to the beginning or end of the array, respectively)
+    Nsigma : float
+        clipping threshold in standard deviations (Default: no clipping)
+    Niter : int
+        number of clipping iterations
+    
+    Returns
+    -------
+    localMean : narray
+        Mean flux in the windows neighboring each window position
+    scale : narray
+        scaled standard deviation of each window's neighborhood
+    
+    Example
+    -------
+    >>> flux = np.array([1.00,1.01,0.99,0.80,0.75,0.95,0.99,0.99,1.00,0.80,1.01])
+    >>> localMean, scale = windowedMean(flux, 4, 2, Nneighb=1)
+    >>> np.allclose(localMean[2], np.mean(np.append(flux[0:4], flux[8:11])))
+    True
+    >>> windowedMean(flux, 4, 2, 1, Nsigma=1.)[0][2]
+    1.0
+    >>> flux[9] = np.nan
+    >>> np.allclose(windowedMean(flux, 4, 2, Nneighb=1)[0][2],
+    ...     np.mean(np.append(flux[0:4], flux[[8, 10]])))
+    True
+    """
+    flux = np.asarray(flux)
+    if not np.issubdtype(flux.dtype, np.floating):
+        flux = flux.astype(float)
+    Ndata = len(flux)
+    starts = np.arange(0, Ndata - winSize, stepSize)
+    if not len(starts):
+        return np.empty(0, dtype=flux.dtype), np.empty(0, dtype=flux.dtype)
+    
+    # neighborhoods of all windows (see `_neighborhood`)
+    N = np.where((starts < winSize) | (starts > Ndata - winSize), 2*Nneighb,
+        Nneighb)
+    iMin = np.maximum(0, starts - N*winSize)
+    iMax = np.minimum(Ndata, starts + (1 + N)*winSize)
+    iRight = starts + winSize
+    
+    # sums over deviations from the median keep the precision of the squares,
+    # non-finite fluxes are left out of them
+    finite = np.isfinite(flux)
+    center = np.median(flux[finite]) if finite.any() else 0.
+    deviation = np.where(finite, flux.astype(float) - center, 0.)
+    keep = finite
+    iWin = _centeredWindows(Ndata, winSize, stepSize, len(starts))
+    for iteration in xrange(Niter if Nsigma is not None else 1):
+        sums = []
+        for values in (keep, deviation*keep, deviation**2*keep):
+            cumulative = np.concatenate([[0.], np.cumsum(values)])
+            sums.append(cumulative[starts] - cumulative[iMin] +
+                cumulative[iMax] - cumulative[iRight])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = sums[1]/sums[0]
+            std = np.sqrt(np.maximum(sums[2]/sums[0] - mean**2, 0.))
+        if Nsigma is not None and iteration < Niter - 1:
+            with np.errstate(invalid='ignore'):
+                keep = finite & (abs(deviation - mean[iWin]) <=
+                    Nsigma*std[iWin])
+    localMean = (mean + center).astype(flux.dtype)
+    return localMean, (0.6744897501960817*std).astype(flux.dtype)
+
+
+def _clippedMean(flux, winSize, stepSize=1, Nneighb=1):
+    """ Local mean and scale of `windowedMean`, clipped at 3 sigma."""
+    return windowedMean(flux, winSize, stepSize, Nneighb, Nsigma=3.)
+
+
+def _sketchLayout(winSize, Nneighb, rankError):
+    """ Number of summary points `k` per block and of data points `m` per
+    summary point of the block sketches of `sketchedMedian`."""
+    k = int(np.ceil(1./rankError))
+    m = int(min(np.sqrt(Nneighb*winSize/float(k)),
+        rankError*Nneighb*winSize/8.))
+    # sketches of less than 3 data points per value do not pay off, m = 1
+    # keeps all data points
+    return k, m if m >= 3 else 1
+
+
+def _sortedBlocks(flux, iFirst, iLast, blockSize):
+    """ Sorted fluxes of the blocks `iFirst` ... `iLast`-1 and their positions
+    in the block; blocks beyond the end of the light curve are filled up
+    with infinite fluxes."""
+    blocks = np.full((iLast - iFirst)*blockSize, np.inf, dtype=flux.dtype)
+    data = flux[iFirst*blockSize:iLast*blockSize]
+    blocks[:len(data)] = data
+    blocks = blocks.reshape(-1, blockSize)
+    order = np.argsort(blocks, axis=1)
+    return np.take_along_axis(blocks, order, axis=1), order
+
+
+def _pieceSketches(sortedBlocks, order, iBlock, iStart, iEnd, k, m):
+    """ Sketches of the data points at the positions `iStart` ... `iEnd`-1 of
+    the blocks `iBlock`: every m-th of their sorted fluxes, starting in the
+    middle of the first m, as rows of k values and a mask of the valid
+    ones."""
+    positions = order[iBlock]
+    inside = (positions >= iStart[:, np.newaxis]) & \
+        (positions < iEnd[:, np.newaxis])
+    rank = np.cumsum(inside, axis=1) - 1
+    rows, cols = np.nonzero(inside & (rank % m == (m - 1)//2))
+    slots = rank[rows, cols]//m
+    values = np.zeros((len(iBlock), k), dtype=sortedBlocks.dtype)
+    valid = np.zeros((len(iBlock), k), dtype=bool)
+    values[rows, slots] = sortedBlocks[iBlock[rows], cols]
+    valid[rows, slots] = True
+    return values, valid
+
+
+def _paddedMedian(values, valid):
+    """ Medians of the valid entries of the rows of `values`, computed like
+    `np.median`. The invalid entries are replaced by as many -inf as inf
+    (plus one inf for an odd number), so that the middle entries of all rows
+    are found by a single partition."""
+    if values.shape[1] % 2:
+        values = np.hstack([values, np.zeros((len(values), 1), values.dtype)])
+        valid = np.hstack([valid, np.zeros((len(valid), 1), bool)])
+    Nvalid = valid.sum(axis=1)
+    padding = ~valid
+    low = padding & (np.cumsum(padding, axis=1) <=
+        ((valid.shape[1] - Nvalid)//2)[:, np.newaxis])
+    values = np.where(valid, values, np.inf)
+    values[low] = -np.inf
+    iMiddle = valid.shape[1]//2
+    middle = np.partition(values, [iMiddle - 1, iMiddle], axis=1)
+    lower = middle[:, iMiddle - 1]
+    upper = np.where(Nvalid % 2, lower, middle[:, iMiddle])
+    return (lower + upper)/2
+
+
+def sketchedMedian(flux, winSize, stepSize=1, Nneighb=1, rankError=0.01,
+        chunkSize=2**20):
+    """ Estimate the local median and MAD for every window position from
+    quantile sketches.
+
+    sketchedMedian is an alternative to `windowedMedian` for neighborhoods
+    of thousands of data points, e.g. of short-cadence or stitched light
+    curves. The light curve is divided into blocks of k*m data points that
+    are sorted once. The sketch of a block keeps every m-th of its sorted
+    fluxes, k values that stand for m data points each, and the data points
+    of a block that belong to a neighborhood are sketched in the same way.
+    Sketches of disjoint sets of data points are merged by joining them, so
+    the median and MAD of a neighborhood are those of the about
+    2*`Nneighb`*`winSize`/m values of its sketches. The block size balances
+    the cost of these medians against that of sketching the blocks at the
+    ends of each neighborhood. Windows at the boundaries of the time series,
+    whose neighborhoods are expanded or truncated, keep their exact medians.
+
+    The error is bounded by ranks: each sketch miscounts the data points
+    below any flux by at most m/2, with k = ceil(1/`rankError`) and m <=
+    `rankError`*`Nneighb`*`winSize`/8. Of the n data points of a
+    neighborhood, the estimated median therefore lies between the exact
+    order statistics of rank n/2 - `rankError`*n and n/2 + `rankError`*n,
+    and the estimated MAD between those of rank n/2 - 2*`rankError`*n and
+    n/2 + 2*`rankError`*n of the absolute deviations from this median. If
+    the bound does not permit m >= 3, the sketches would hardly be smaller
+    than the neighborhoods, and the exact `windowedMedian` is returned.
+
+    Parameters
+    ----------
+    flux : narray
+        A numpy array with the flux data
+    winSize : int
+        Size of a window
+    stepSize : int
+        steps per slide (Default = 1, i.e. slide one data point per iteration).
+    Nneighb : int
+        Number of neighboring windows per side to be considered for the local
+        median (At the boundaries of the time series, the considered data
+        extends to the beginning or end of the array, respectively)
+    rankError : float
+        maximum rank error of the median as a fraction of the neighborhood
+    chunkSize : int
+        Maximum number of block and sketch values that are held in memory
+
+    Returns
+    -------
+    localMedian : narray
+        estimated median of the flux in the windows neighboring each window
+        position
+    MAD : narray
+        estimated median absolute deviation of each window's neighborhood
+
+    Example
+    -------
+    >>> np.random.seed(1)
+    >>> flux = np.random.normal(1.0, 0.01, 20000)
+    >>> localMedian, MAD = sketchedMedian(flux, 1000, 500, 2, rankError=0.01)
+    >>> localMedian[5] == get_localMedian(flux, 2500, 1000, 2, rankError=0.01)[0]
+    True
+    >>> (iMin, iLeft), (iRight, iMax) = _neighborhood(2500, 1000, 2, len(flux))
+    >>> neighborhood = np.append(flux[iMin:iLeft], flux[iRight:iMax])
+    >>> abs(np.mean(neighborhood < localMedian[5]) - 0.5) <= 0.01
+    True
+    """
+    flux = np.asarray(flux)
+    if not np.issubdtype(flux.dtype, np.floating):
+        flux = flux.astype(float)
+    starts = np.arange(0, len(flux) - winSize, stepSize)
+    return _sketchedBlock(flux, starts, winSize, stepSize, Nneighb, rankError,
+        chunkSize)
+
+
+def _sketchedBlock(flux, starts, winSize, stepSize, Nneighb, rankError,
+        chunkSize=2**20):
+    """ Local medians and MADs of `sketchedMedian` for the windows beginning
+    at the ascending indices `starts`."""
+    Ndata = len(flux)
+    k, m = _sketchLayout(winSize, Nneighb, rankError)
+    interior = (starts >= max(winSize, Nneighb*winSize)) & \
+        (starts + (1 + Nneighb)*winSize <= Ndata) & (Nneighb > 0)
+    if m == 1 or not interior.any():
+        return _blockMedian(flux, starts, winSize, stepSize, Nneighb, Ndata,
+            chunkSize=chunkSize)
+    localMedian = np.empty(len(starts), dtype=flux.dtype.type)
+    MAD = np.empty(len(starts), dtype=flux.dtype.type)
+    localMedian[~interior], MAD[~interior] = _blockMedian(flux,
+        starts[~interior], winSize, stepSize, Nneighb, Ndata)
+    localMedian[interior], MAD[interior] = _interiorSketch(flux,
+        starts[interior], winSize, Nneighb, k, m, chunkSize)
+    return localMedian, MAD
+
+
+def _interiorSketch(flux, starts, winSize, Nneighb, k, m, chunkSize=2**20):
+    """ Local medians and MADs of windows at the indices `starts` whose
+    neighborhoods are neither expanded nor truncated, estimated from
+    sketches of blocks of k*m data points."""
+    blockSize = k*m
+    Nside = Nneighb*winSize
+    Nfull = Nside//blockSize
+    localMedian = np.empty(len(starts), dtype=flux.dtype.type)
+    MAD = np.empty(len(starts), dtype=flux.dtype.type)
+    NwinChunk = max(1, chunkSize//(4*blockSize + 2*(Nfull + 2)*k))
+    for j in xrange(0, len(starts), NwinChunk):
+        chunk = starts[j:j + NwinChunk]
+        iFirst = (chunk[0] - Nside)//blockSize
+        iLast = (chunk[-1] + winSize + Nside)//blockSize + 1
+        sortedBlocks, order = _sortedBlocks(flux, iFirst, iLast, blockSize)
+        sketches = sortedBlocks[:, (m - 1)//2::m]
+
+        # each side of a neighborhood consists of complete blocks, which are
+        # represented by their sketches, and parts of a first and last block
+        values, valid = [], []
+        for lo in (chunk - Nside, chunk + winSize):
+            hi = lo + Nside
+            head, tail = lo//blockSize, hi//blockSize
+            iBlock = head[:, np.newaxis] + 1 + np.arange(Nfull)
+            values.append(sketches[np.minimum(iBlock, iLast - 1) - iFirst]\
+                .reshape(len(chunk), -1))
+            valid.append(np.repeat(iBlock < tail[:, np.newaxis], k, axis=1))
+            pieces = ((head, lo - head*blockSize,
+                np.minimum(blockSize, hi - head*blockSize)),
+                (np.minimum(tail, iLast - 1), np.zeros_like(tail),
+                np.where(tail > head, hi - tail*blockSize, 0)))
+            for iBlock, iStart, iEnd in pieces:
+                pieceValues, pieceValid = _pieceSketches(sortedBlocks, order,
+                    iBlock - iFirst, iStart, iEnd, k, m)
+                values.append(pieceValues)
+                valid.append(pieceValid)
+        values, valid = np.hstack(values), np.hstack(valid)
+        median = _paddedMedian(values, valid)
+        localMedian[j:j + NwinChunk] = median
+        MAD[j:j + NwinChunk] = _paddedMedian(abs(values -
+            median[:, np.newaxis]), valid)
+    return localMedian, MAD
+
+
+def _baselineProfile(baseline, method, rankError=0.01):
+    """ Function that computes the local baseline and scale of all window
+    positions for the kind of `baseline`."""
+    if baseline == 'median':
+        return rollingMedian if method == 'loop' else windowedMedian
+    if baseline == 'sketch':
+        return lambda flux, winSize, stepSize, Nneighb: sketchedMedian(flux,
+            winSize, stepSize, Nneighb, rankError)
+    return windowedMean if baseline == 'mean' else _clippedMean
+
+
+def _fluxThresholds(localMedian, localMAD, detectionThresh, fluxType):
+    """ Flux thresholds of many windows, rounded like the scalar arithmetic of
+    `findDip` and cast to the precision numpy uses to compare a flux array of
+    type `fluxType` with them.
+    """
+    scalarType = type(detectionThresh*localMedian.dtype.type(1.))
+    fluxThresh = np.minimum(detectionThresh*localMedian.astype(scalarType),
+        localMedian - localMAD)
+    compareType = np.result_type(np.empty(0, fluxType),
+        fluxThresh.dtype.type(1.))
+    return fluxThresh.astype(compareType)
+
+
+def _dipEnds(low):
+    """ Find the ends of all candidate dips in the rows of a low-flux mask.
+    
+    A candidate dip ends at the second of two consecutive high fluxes that
+    follow at least one low flux. Returns a mask of these ends, the number of
+    low fluxes since the previous pair of high fluxes for every position, and
+    the position of that pair (0 if there is none).
+    """
+    Nrows, Ncols = low.shape
+    doubleHigh = np.zeros_like(low)
+    doubleHigh[:, 1:] = ~low[:, 1:] & ~low[:, :-1]
+    
+    # number of low fluxes before each position and since the previous pair
+    # of high fluxes (index 0 serves as sentinel, it cannot end a dip)
+    NloBefore = np.cumsum(low, axis=1) - low
+    lastDoubleHigh = np.maximum.accumulate(
+        np.where(doubleHigh, np.arange(Ncols), 0), axis=1)
+    prevDoubleHigh = np.zeros_like(lastDoubleHigh)
+    prevDoubleHigh[:, 1:] = lastDoubleHigh[:, :-1]
+    NloFlux = NloBefore - \
+        NloBefore[np.arange(Nrows)[:, np.newaxis], prevDoubleHigh]
+    return doubleHigh & (NloFlux > 0), NloFlux, prevDoubleHigh
+
+
+def findDips(timeWindows, fluxWindows, minDur=1, maxDur=5, localMedian=1.00,
+        fluxThresh=0.99):
+    """ Search for dips in a stack of windows at once.
+    
+    findDips applies the rules of `findDip` to every row of the 2-D arrays
+    `timeWindows` and `fluxWindows` using array operations only. A dip ends at
+    the second of two consecutive data points above the threshold, so the
+    number of low fluxes in a candidate dip is the number of low fluxes since
+    the previous pair of high fluxes. The first candidate per row whose length
+    lies between `minDur` and `maxDur` is returned.
+    
+    Parameters
+    ----------
+    timeWindows : array
+        (Nwin, winSize) numpy array containing time data
+    fluxWindows : array
+        (Nwin, winSize) numpy array containing flux data
+    minDur : int
+        minimum dip duration in # of data points
+    maxDur : int
+        maximum dip duration in # of data points
+    localMedian : array
+        local median flux of every window
+    fluxThresh : array
+        flux threshold of every window
+    
+    Returns
+    -------
+    detected : array
+        boolean array that flags the windows with a dip
+    t_egress : array
+        time at end of detected dip (only valid where `detected`)
+    minFlux : array
+        Minimum flux relative to localMedian (only valid where `detected`)
+        
+    Example
+    -------
+    >>> timeWindows = np.array([[0.,1.,2.,3.,4.,5., 6.]])
+    >>> fluxWindows = np.array([[1.00,1.01,0.99,0.80,0.75,0.95,0.96]])
+    >>> findDips(timeWindows, fluxWindows, localMedian=np.ones(1),
+    ...     fluxThresh=np.array([0.90]))
+    (array([ True]), array([5.]), array([0.75]))
+    """
+    Nwin, winSize = fluxWindows.shape
+    localMedian = np.broadcast_to(localMedian, (Nwin,))
+    fluxThresh = np.broadcast_to(fluxThresh, (Nwin,))
+    
+    low = fluxWindows < fluxThresh[:, np.newaxis]
+    isEnd, NloFlux, _ = _dipEnds(low)
+    return _firstDips(timeWindows, fluxWindows, isEnd, NloFlux, minDur, maxDur,
+        localMedian)
+
+
+def _firstDips(timeWindows, fluxWindows, isEnd, NloFlux, minDur, maxDur,
+        localMedian):
+    """ Select the first dip of valid length in each window from the
+    candidate dips found by `_dipEnds`."""
+    Nwin, winSize = fluxWindows.shape
+    rows = np.arange(Nwin)
+    isDip = isEnd & (NloFlux >= minDur) & (NloFlux <= maxDur)
+    detected = isDip.any(axis=1)
+    iEnd = np.clip(isDip.argmax(axis=1), 2, winSize)
+    t_egress = timeWindows[rows, iEnd - 1]
+    minFlux = np.minimum.accumulate(fluxWindows, axis=1)[rows, iEnd - 2]/\
+        localMedian
+    return detected, t_egress, minFlux
+
+
+def _loopDetections(t, flux, winSize, stepSize, minDur, maxDur, baselines,
+        detectionThresh):
+    """ Yield the result of `findDip` for every window position, given an
+    iterable of the (localMedian, MAD) pairs of all positions."""
+    starts = xrange(0, len(flux) - winSize, stepSize)
+    for i, (localMedian, localMAD) in itertools.izip(starts, baselines):
+        timeWindow = t[i:i + winSize]
+        fluxWindow = flux[i:i + winSize]
+        yield findDip(timeWindow, fluxWindow, minDur, maxDur,\
+            localMedian, localMAD, detectionThresh)
+
+
+def _vectorizedDetections(t, flux, winSize, stepSize, minDur, maxDur,
+        localMedians, localMADs, detectionThresh, chunkSize=2**20):
+    """ Yield the dips of all window positions, found by `findDips` in blocks
+    of at most `chunkSize` window data points."""
+    Nwin = len(localMedians)
+    timeWindows = _windowView(t, winSize, stepSize, Nwin)
+    fluxWindows = _windowView(flux, winSize, stepSize, Nwin)
+    fluxThresh = _fluxThresholds(localMedians, localMADs, detectionThresh,
+        fluxWindows.dtype)
+    NwinChunk = max(1, chunkSize//winSize)
+    for j in xrange(0, Nwin, NwinChunk):
+        chunk = slice(j, j + NwinChunk)
+        detected, t_egress, minFlux = findDips(timeWindows[chunk],
+            fluxWindows[chunk], minDur, maxDur, localMedians[chunk],
+            fluxThresh[chunk])
+        for k in np.flatnonzero(detected):
+            yield t_egress[k], minFlux[k]
+
+
+def _centeredWindows(Ndata, winSize, stepSize, Nwin):
+    """ Index of the window position centered closest to every data point."""
+    return np.clip((np.arange(Ndata) - winSize//2 + stepSize//2)//stepSize, 0,
+        Nwin - 1)
+
+
+def _globalDetections(t, flux, winSize, stepSize, minDur, maxDur,
+        localMedians, localMADs, detectionThresh):
+    """ Yield all dips found in a single pass over the whole light curve.
+    
+    Every data point is compared to the threshold of the window position
+    centered closest to it, and runs of low fluxes are checked against the
+    rules of `findDip` only once instead of once per window.
+    """
+    Nwin = len(localMedians)
+    if not Nwin:
+        return
+    fluxThresh = _fluxThresholds(localMedians, localMADs, detectionThresh,
+        flux.dtype)
+    iWin = _centeredWindows(len(flux), winSize, stepSize, Nwin)
+    
+    low = flux < fluxThresh[iWin]
+    isEnd, NloFlux, prevDoubleHigh = _dipEnds(low[np.newaxis])
+    iEnd = np.flatnonzero(isEnd[0] & (NloFlux[0] >= minDur) &
+        (NloFlux[0] <= maxDur))
+    if not len(iEnd):
+        return
+    
+    # minimum flux between the previous pair of high fluxes and the egress
+    iStart = prevDoubleHigh[0, iEnd]
+    iStart[iStart > 0] += 1
+    minFlux = np.minimum.reduceat(flux,
+        np.ravel(np.column_stack([iStart, iEnd - 1])))[::2]
+    minFlux = minFlux/localMedians[iWin[iEnd - 1]]
+    for t_egress, f_rel in zip(t[iEnd - 1], minFlux):
+        yield t_egress, f_rel
+
+
+class DipBuffer(object):
+    """ Append-only columnar buffer for detected dips.
+    
+    DipBuffer stores the columns 'EPIC', 't_egress' and 'minFlux' in numpy
+    arrays that grow by doubling their capacity, so that collecting N dips
+    costs O(N) instead of copying a growing Astropy table for every new dip.
+    Columns are available as array views with ``buffer['t_egress']``; an
+    Astropy table is only built by `to_table`.
+    
+    Parameters
+    ----------
+    capacity : int
+        Number of dips the buffer can hold before it grows for the first time
+        
+    Example
+    -------
+    >>> dips = DipBuffer()
+    >>> dips.append('9999999', 12.5, 0.98)
+    >>> dips.extend({'EPIC': [1, 1], 't_egress': [3., 4.], 'minFlux': [.9, .8]})
+    >>> len(dips), dips['EPIC']
+    (3, array([9999999,       1,       1]))
+    >>> print(dips.to_table())
+      EPIC  t_egress minFlux
+    ------- -------- -------
+    9999999     12.5    0.98
+          1      3.0     0.9
+          1      4.0     0.8
+    """
+    names = ('EPIC', 't_egress', 'minFlux')
+    dtypes = ('i8', float, float)
+    
+    def __init__(self, capacity=16):
+        self._columns = [np.empty(capacity, dtype=dtype)
+            for dtype in self.dtypes]
+        self._N = 0
+        
+    def __len__(self):
+        return self._N
+    
+    def __getitem__(self, name):
+        return self._columns[self.names.index(name)][:self._N]
+    
+    def _reserve(self, N):
+        """ Grow the columns to hold at least `N` dips."""
+        capacity = len(self._columns[0])
+        if N > capacity:
+            capacity = max(N, 2*capacity)
+            for i, column in enumerate(self._columns):
+                self._columns[i] = np.empty(capacity, dtype=column.dtype)
+                self._columns[i][:self._N] = column[:self._N]
+    
+    def append(self, EPICno, t_egress, minFlux):
+        """ Add a single dip to the buffer."""
+        self._reserve(self._N + 1)
+        for column, value in zip(self._columns, (EPICno, t_egress, minFlux)):
+            column[self._N] = value
+        self._N += 1
+        
+    def extend(self, dips):
+        """ Add all dips of a table, DipBuffer or dict of columns."""
+        N = len(dips[self.names[0]])
+        self._reserve(self._N + N)
+        for column, name in zip(self._columns, self.names):
+            column[self._N:self._N + N] = dips[name]
+        self._N += N
+    
+    def extend_target(self, EPICno, t_egress, minFlux):
+        """ Add the dips of a single target, given as arrays of their egress
+        times and minimum fluxes (see `dipsearch_arrays`)."""
+        N = len(t_egress)
+        self._reserve(self._N + N)
+        for column, values in zip(self._columns, (EPICno, t_egress, minFlux)):
+            column[self._N:self._N + N] = values
+        self._N += N
+    
+    def to_table(self):
+        """ Return the dips as an Astropy table."""
+        return Table([self[name] for name in self.names], names=self.names,
+            dtype=self.dtypes)
+
+
+def _sweepDetections(t, flux, winSize, stepSize, localMedians, localMADs,
+        thresholds, durations, chunkSize=2**20):
+    """ Yield the dips of all window positions for several thresholds and
+    duration limits that share the same local medians.
+    
+    The minimum flux of every window is computed once. For each threshold,
+    only the windows whose minimum falls short of it are searched, and the
+    candidate dips of these windows are shared by all duration limits, so
+    that the cost of an additional configuration grows with the number of
+    windows that contain low fluxes instead of the length of the light curve.
+    Yields (index of threshold, index of duration limits, t_egress, minFlux)
+    in the order of the windows for each threshold.
+    """
+    Nwin = len(localMedians)
+    timeWindows = _windowView(t, winSize, stepSize, Nwin)
+    fluxWindows = _windowView(flux, winSize, stepSize, Nwin)
+    NwinChunk = max(1, chunkSize//winSize)
+    winMin = np.empty(Nwin, dtype=flux.dtype)
+    for j in xrange(0, Nwin, NwinChunk):
+        winMin[j:j + NwinChunk] = np.fmin.reduce(fluxWindows[j:j + NwinChunk],
+            axis=1)
+    
+    for iThresh, detectionThresh in enumerate(thresholds):
+        fluxThresh = _fluxThresholds(localMedians, localMADs, detectionThresh,
+            fluxWindows.dtype)
+        candidates = np.flatnonzero(winMin < fluxThresh)
+        dips = [[] for durationLimits in durations]
+        for j in xrange(0, len(candidates), NwinChunk):
+            chunk = candidates[j:j + NwinChunk]
+            timeChunk, fluxChunk = timeWindows[chunk], fluxWindows[chunk]
+            isEnd, NloFlux, _ = _dipEnds(fluxChunk <
+                fluxThresh[chunk, np.newaxis])
+            for iDur, (minDur, maxDur) in enumerate(durations):
+                detected, t_egress, minFlux = _firstDips(timeChunk, fluxChunk,
+                    isEnd, NloFlux, minDur, maxDur, localMedians[chunk])
+                dips[iDur].extend(zip(t_egress[detected], minFlux[detected]))
+        for iDur in xrange(len(durations)):
+            for t_egress, minFlux in dips[iDur]:
+                yield iThresh, iDur, t_egress, minFlux
+
+
+def _checkParameters(winSize, minDur, maxDur):
+    """ Check if parameters are consistent."""
+    if minDur > maxDur:
+        raise ValueError('min dip duration greater than max dip duration')
+    if winSize <= maxDur:
+        raise ValueError('max dip duration greater than or equal window size')
+
+
+def screenWindows(flux, winSize, stepSize=1, Nneighb=1, detectionThresh=0.995,
+        screenBin=5, screenThresh=None, chunkSize=2**20):
+    """ Flag the window positions that may contain a dip.
+    
+    screenWindows is the cheap first stage of a coarse-to-fine dip search.
+    The local median of every window is estimated from a light curve binned
+    by `screenBin` data points: the median of the bin medians in the
+    neighborhood of `Nneighb` windows of `winSize`//`screenBin` bins per
+    side. Near the boundaries of the time series, the estimate of the
+    closest complete neighborhood is used. A window is flagged if its lowest
+    flux falls short of `screenThresh` times this estimate. A window can only
+    contain a dip if its lowest flux lies below `detectionThresh` times the
+    exact local median, so a loose `screenThresh` keeps all windows with
+    dips as long as the estimate errs by less than the difference of both
+    thresholds.
+    
+    Parameters
+    ----------
+    flux : narray
+        A numpy array with the flux data
+    winSize, stepSize, Nneighb, detectionThresh
+        parameters of the dip search (see `dipsearch`)
+    screenBin : int
+        number of data points per bin (1 <= `screenBin` <= `winSize`)
+    screenThresh : float
+        fraction of the estimated local median below which a window is
+        flagged (Default: halfway between `detectionThresh` and 1)
+    chunkSize : int
+        Maximum number of window data points that are held in memory
+    
+    Returns
+    -------
+    flagged : narray
+        boolean array that flags the window positions 0, `stepSize`,
+        2*`stepSize`, ... < len(flux) - `winSize` that have to be searched
+    
+    Example
+    -------
+    >>> np.random.seed(99)
+    >>> flux = np.random.normal(1.0, 0.001, 1000)
+    >>> flux[500:503] = 0.99
+    >>> flagged = screenWindows(flux, 10, Nneighb=2)
+    >>> flagged.sum(), len(flagged), flagged[495]
+    (105, 990, True)
+    """
+    flux = np.asarray(flux)
+    if not np.issubdtype(flux.dtype, np.floating):
+        flux = flux.astype(float)
+    if not 1 <= screenBin <= winSize:
+        raise ValueError('bin size of the screen must lie between 1 and the '
+            'window size')
+    if screenThresh is None:
+        screenThresh = (1. + detectionThresh)/2.
+    starts = np.arange(0, len(flux) - winSize, stepSize)
+    Nwin = len(starts)
+    
+    # lowest flux of every window
+    winMin = np.empty(Nwin, dtype=flux.dtype)
+    fluxWindows = _windowView(flux, winSize, stepSize, Nwin)
+    NwinChunk = max(1, chunkSize//winSize)
+    for j in xrange(0, Nwin, NwinChunk):
+        winMin[j:j + NwinChunk] = np.fmin.reduce(fluxWindows[j:j + NwinChunk],
+            axis=1)
+    
+    # local medians estimated from the medians of the bins in complete
+    # neighborhoods
+    Nbins = len(flux)//screenBin
+    binned = np.median(flux[:Nbins*screenBin].reshape(Nbins, screenBin),
+        axis=1)
+    winBins = winSize//screenBin
+    iFirst = max(winBins, Nneighb*winBins)
+    iLast = Nbins - (1 + Nneighb)*winBins
+    if Nneighb < 1 or iLast < iFirst:
+        return np.ones(Nwin, dtype=bool)
+    binMedian, binMAD = _interiorMedian(binned, iFirst, iLast + 1 - iFirst,
+        winBins, 1, Nneighb, chunkSize)
+    iBin = np.clip(np.round(starts/float(screenBin)).astype(int), iFirst,
+        iLast) - iFirst
+    
+    # NaN estimates flag their windows, too
+    return ~(winMin >= screenThresh*binMedian[iBin])
+
+
+def _blockDetections(t, flux, winSize, stepSize, Nneighb, minDur, maxDur,
+        detectionThresh, chunkSize):
+    """ Yield the dips of `_vectorizedDetections`, computing the local
+    medians of only as many windows at a time as fit into `chunkSize` window
+    data points."""
+    baselineFlux = flux if np.issubdtype(flux.dtype, np.floating) else \
+        flux.astype(float)
+    starts = np.arange(0, len(flux) - winSize, stepSize)
+    NwinBlock = max(1, chunkSize//winSize)
+    for j in xrange(0, len(starts), NwinBlock):
+        block = starts[j:j + NwinBlock]
+        localMedians, localMADs = _blockMedian(baselineFlux, block, winSize,
+            stepSize, Nneighb, len(flux))
+        for detection in _vectorizedDetections(t[block[0]:], flux[block[0]:],
+                winSize, stepSize, minDur, maxDur, localMedians, localMADs,
+                detectionThresh):
+            yield detection
+
+
+def _screenedDetections(t, flux, winSize, stepSize, Nneighb, minDur, maxDur,
+        detectionThresh, flagged, chunkSize, profile=None):
+    """ Yield the dips of the windows that `flagged` marks, whose data are
+    gathered in blocks of at most `chunkSize` window data points. Their local
+    medians are computed unless the local baselines and scales of all
+    windows are given as `profile`."""
+    baselineFlux = flux if np.issubdtype(flux.dtype, np.floating) else \
+        flux.astype(float)
+    starts = np.arange(0, len(flux) - winSize, stepSize)[flagged]
+    if profile is not None:
+        profile = [values[flagged] for values in profile]
+    NwinBlock = max(1, chunkSize//winSize)
+    for j in xrange(0, len(starts), NwinBlock):
+        block = starts[j:j + NwinBlock]
+        if profile is None:
+            localMedians, localMADs = _blockMedian(baselineFlux, block,
+                winSize, stepSize, Nneighb, len(flux))
+        else:
+            localMedians, localMADs = [values[j:j + NwinBlock] for values in
+                profile]
+        windows = block[:, np.newaxis] + np.arange(winSize)
+        fluxWindows = flux[windows]
+        fluxThresh = _fluxThresholds(localMedians, localMADs, detectionThresh,
+            fluxWindows.dtype)
+        detected, t_egress, minFlux = findDips(t[windows], fluxWindows, minDur,
+            maxDur, localMedians, fluxThresh)
+        for k in np.flatnonzero(detected):
+            yield t_egress[k], minFlux[k]
+
+
+def _detections(t, flux, winSize, stepSize, Nneighb, minDur, maxDur,
+        detectionThresh, method, baseline, baselineCache, screenBin,
+        screenThresh, rankError, workers, chunkSize):
+    """ Return an iterator over the detections of all window positions that
+    computes the local medians only as far ahead as `method` allows, or only
+    of the windows flagged by `screenWindows`."""
+    if screenBin is not None:
+        flagged = screenWindows(flux, winSize, stepSize, Nneighb,
+            detectionThresh, screenBin, screenThresh)
+    if baseline == 'median' and baselineCache is None:
+        if screenBin is not None:
+            return _screenedDetections(t, flux, winSize, stepSize, Nneighb,
+                minDur, maxDur, detectionThresh, flagged, chunkSize)
+        if method == 'loop':
+            baselineFlux = flux if np.issubdtype(flux.dtype, np.floating) \
+                else flux.astype(float)
+            return _loopDetections(t, flux, winSize, stepSize, minDur, maxDur,
+                _rollingMedians(baselineFlux, winSize, stepSize, Nneighb),
+                detectionThresh)
+        if method == 'vectorized' and workers > 1:
+            return _parallelDetections(t, flux, winSize, stepSize, Nneighb,
+                minDur, maxDur, detectionThresh, workers, chunkSize)
+        if method == 'vectorized':
+            return _blockDetections(t, flux, winSize, stepSize, Nneighb,
+                minDur, maxDur, detectionThresh, chunkSize)
+    
+    # local baseline and scale of all window positions at once
+    profile = _baselineProfile(baseline, method, rankError)
+    if baselineCache is not None:
+        kind = baseline if baseline != 'sketch' else \
+            'sketch{!r}'.format(rankError)
+        localMedians, localMADs = baselineCache.load(flux, winSize, stepSize,
+            Nneighb, profile, kind=kind)
+    else:
+        localMedians, localMADs = profile(flux, winSize, stepSize, Nneighb)
+    if screenBin is not None:
+        return _screenedDetections(t, flux, winSize, stepSize, Nneighb,
+            minDur, maxDur, detectionThresh, flagged, chunkSize,
+            (localMedians, localMADs))
+    if method == 'loop':
+        return _loopDetections(t, flux, winSize, stepSize, minDur, maxDur,
+            itertools.izip(localMedians, localMADs), detectionThresh)
+    detections = _vectorizedDetections if method == 'vectorized' else \
+        _globalDetections
+    return detections(t, flux, winSize, stepSize, minDur, maxDur,
+        localMedians, localMADs, detectionThresh)
+
+
+def _iterDips(detections, t_minDur):
+    """ Yield the detections that are new dips."""
+    prev_t_egress = 0.
+    for t_egress, minFlux in detections:
+        if t_egress:
+            # check if detected dip is a new one
+            if (t_egress - prev_t_egress) > t_minDur:
+                yield t_egress, minFlux
+                prev_t_egress = t_egress
+
+
+def iter_dips(t, flux, winSize=10, stepSize=1, Nneighb=2, minDur=2, maxDur=5,
+        detectionThresh=0.995, method='loop', baselineCache=None,
+        cadence=None, screenBin=None, screenThresh=None, baseline='median',
+        rankError=0.01, workers=1, chunkSize=2**16):
+    """ Iterate over the dips of a light curve while the search proceeds.
+    
+    iter_dips finds the same dips as `dipsearch`, but it yields them one
+    after the other as (t_egress, minFlux) tuples instead of returning a
+    table. The local medians are computed along with the search (except for
+    `method`='global', other kinds of `baseline` or with a `baselineCache`),
+    so that a caller who stops the iteration early, e.g. after the first dip,
+    skips the rest of the light curve.
+    
+    Parameters
+    ----------
+    t : narray
+        times of the data points
+    flux : narray
+        fluxes of the data points
+    winSize, stepSize, Nneighb, minDur, maxDur, detectionThresh, method,
+    baselineCache, cadence, screenBin, screenThresh, baseline, rankError,
+    workers
+        parameters of the dip search (see `dipsearch`)
+    chunkSize : int
+        number of window data points that `method`='vectorized' searches at
+        once, and in each segment with several `workers`. Smaller blocks
+        stop sooner after the last dip that is taken.
+    
+    Returns
+    -------
+    dips : generator
+        yields the egress time and the minimum flux relative to the local
+        median of every dip
+    
+    Example
+    -------
+    >>> np.random.seed(99)
+    >>> t, flux = np.arange(1000.), np.random.normal(1.0, 0.001, 1000)
+    >>> flux[[150, 151, 152, 480, 481, 970, 971]] = 0.99
+    >>> [t_egress for t_egress, minFlux in iter_dips(t, flux)]
+    [153.0, 482.0, 972.0]
+    >>> next(iter_dips(t, flux, method='vectorized'))[0]
+    153.0
+    """
+    _checkParameters(winSize, minDur, maxDur)
+    if method not in ('loop', 'vectorized', 'global'):
+        raise ValueError('unknown dip search method "{}"'.format(method))
+    if method == 'global' and screenBin is not None:
+        raise ValueError('method "global" cannot be combined with a screen')
+    if baseline not in ('median', 'mean', 'clipped-mean', 'sketch'):
+        raise ValueError('unknown baseline "{}"'.format(baseline))
+    if baseline == 'sketch' and not rankError > 0:
+        raise ValueError('rank error of the sketch must be positive')
+    if workers < 1:
+        raise ValueError('number of workers must be positive')
+    if workers > 1 and (method != 'vectorized' or baseline != 'median' or
+            baselineCache is not None or screenBin is not None):
+        raise ValueError('several workers require method "vectorized" and '
+            'the median baseline without a cache or screen')
+    t = np.ascontiguousarray(t)
+    flux = np.ascontiguousarray(flux)
+    
+    # compute min dip duration in days
+    if cadence is None:
+        cadence = (t[-1] - t[0])/len(t)
+    t_minDur = minDur*cadence
+    
+    return _iterDips(_detections(t, flux, winSize, stepSize, Nneighb, minDur,
+        maxDur, detectionThresh, method, baseline, baselineCache, screenBin,
+        screenThresh, rankError, workers, chunkSize), t_minDur)
+
+
+def has_dip(t, flux, **parameters):
+    """ Check if a light curve has any dip and stop at the first one.
+    
+    Parameters
+    ----------
+    t : narray
+        times of the data points
+    flux : narray
+        fluxes of the data points
+    parameters
+        parameters of the dip search (see `iter_dips`)
+    
+    Returns
+    -------
+    hasDip : bool
+        True if `dipsearch` with the same parameters finds at least one dip
+    
+    Example
+    -------
+    >>> np.random.seed(99)
+    >>> t, flux = np.arange(1000.), np.random.normal(1.0, 0.001, 1000)
+    >>> has_dip(t, flux)
+    False
+    >>> flux[150:153] = 0.99
+    >>> has_dip(t, flux)
+    True
+    """
+    for dip in iter_dips(t, flux, **parameters):
+        return True
+    return False
+
+
+def dipsearch_arrays(t, flux, winSize=10, stepSize=1, Nneighb=2, minDur=2,
+        maxDur=5, detectionThresh=0.995, method='loop', baselineCache=None,
+        cadence=None, screenBin=None, screenThresh=None, baseline='median',
+        rankError=0.01, workers=1):
+    """ Search the time and flux arrays of a light curve for dips.
+    
+    dipsearch_arrays is the core of `dipsearch` without Astropy tables. It
+    works on the arrays it is given, so views, memory maps or shared memory
+    are searched without copying them as long as they are contiguous, and it
+    returns the dips as plain arrays.
+    
+    Parameters
+    ----------
+    t : narray
+        times of the data points
+    flux : narray
+        fluxes of the data points
+    winSize, stepSize, Nneighb, minDur, maxDur, detectionThresh, method,
+    baselineCache, cadence, screenBin, screenThresh, baseline, rankError,
+    workers
+        parameters of the dip search (see `dipsearch`)
+    
+    Returns
+    -------
+    t_egress : narray
+        times at the end of the detected dips
+    minFlux : narray
+        minimum fluxes of the dips relative to the local median
+    
+    Example
+    -------
+    >>> np.random.seed(99)
+    >>> t, flux = np.arange(1000.), np.random.normal(1.0, 0.001, 1000)
+    >>> flux[[150, 151, 152, 480, 481]] = 0.99
+    >>> t_egress, minFlux = dipsearch_arrays(t, flux)
+    >>> t_egress
+    array([153., 482.])
+    """
+    dips = np.array(list(iter_dips(t, flux, winSize, stepSize, Nneighb,
+        minDur, maxDur, detectionThresh, method, baselineCache, cadence,
+        screenBin, screenThresh, baseline, rankError, workers)),
+        dtype=float).reshape(-1, 2)
+    return dips[:, 0].copy(), dips[:, 1].copy()
+
+
+def _segmentDetections(t, flux, starts, winSize, stepSize, Nneighb, minDur,
+        maxDur, detectionThresh):
+    """ List the dips of `_blockDetections` of the consecutive windows
+    beginning at `starts`, reading only the segment of the light curve that
+    the windows and their neighborhoods cover."""
+    Ndata = len(flux)
+
+    # halo of the neighborhoods: `Nneighb` windows before the first window
+    # and 1 + `Nneighb` windows after the last window start, or 1 +
+    # 2*`Nneighb` windows for the expanded neighborhoods of windows that
+    # start within the first window
+    iFirst = max(0, starts[0] - Nneighb*winSize)
+    iLast = min(Ndata, max(starts[-1] + (1 + Nneighb)*winSize,
+        min(starts[-1], winSize - 1) + (1 + 2*Nneighb)*winSize))
+    fluxSegment = np.ascontiguousarray(flux[iFirst:iLast])
+    baselineFlux = fluxSegment if np.issubdtype(fluxSegment.dtype,
+        np.floating) else fluxSegment.astype(float)
+    localMedians, localMADs = _blockMedian(baselineFlux, starts, winSize,
+        stepSize, Nneighb, Ndata, iFirst)
+    return list(_vectorizedDetections(
+        np.ascontiguousarray(t[starts[0]:starts[-1] + winSize]),
+        fluxSegment[starts[0] - iFirst:], winSize, stepSize, minDur, maxDur,
+        localMedians, localMADs, detectionThresh))
+
+
+def _chunkedDetections(t, flux, winSize, stepSize, Nneighb, minDur, maxDur,
+        detectionThresh, chunkLength):
+    """ Yield the dips of `_blockDetections`, reading the windows beginning
+    in `chunkLength` consecutive data points at a time together with the
+    data their neighborhoods extend to."""
+    Nwin = len(xrange(0, len(flux) - winSize, stepSize))
+    NwinChunk = max(1, chunkLength//stepSize)
+    for j in xrange(0, Nwin, NwinChunk):
+        starts = stepSize*np.arange(j, min(Nwin, j + NwinChunk))
+        for detection in _segmentDetections(t, flux, starts, winSize,
+                stepSize, Nneighb, minDur, maxDur, detectionThresh):
+            yield detection
+
+
+def _parallelDetections(t, flux, winSize, stepSize, Nneighb, minDur, maxDur,
+        detectionThresh, workers, chunkSize):
+    """ Yield the dips of `_blockDetections`, searching its blocks of
+    `chunkSize` window data points as segments concurrently in a pool of
+    `workers` threads and yielding their dips in the order of the
+    segments."""
+    Nwin = len(xrange(0, len(flux) - winSize, stepSize))
+    NwinSegment = max(1, chunkSize//winSize)
+
+    def search(j):
+        starts = stepSize*np.arange(j, min(Nwin, j + NwinSegment))
+        return _segmentDetections(t, flux, starts, winSize, stepSize,
+            Nneighb, minDur, maxDur, detectionThresh)
+
+    segments = xrange(0, Nwin, NwinSegment)
+    if len(segments) < 2:
+        for j in segments:
+            for detection in search(j):
+                yield detection
+        return
+    pool = ThreadPool(min(workers, len(segments)))
+    try:
+        for detections in pool.imap(search, segments):
+            for detection in detections:
+                yield detection
+    finally:
+        pool.terminate()
+
+
+def dipsearch_chunked(t, flux, winSize=10, stepSize=1, Nneighb=2, minDur=2,
+        maxDur=5, detectionThresh=0.995, cadence=None, chunkLength=2**22):
+    """ Search a light curve that does not fit into memory for dips.
+
+    dipsearch_chunked reads the time and flux arrays in chunks of
+    `chunkLength` data points, each with a halo of the `Nneighb` windows
+    before and the 1 + `Nneighb` windows after it that the neighborhoods of
+    its windows extend to, so only about `chunkLength` + (1 + 2*`Nneighb`)*
+    `winSize` data points are held in memory at a time. The arrays may be
+    anything that can be sliced into numpy arrays, such as memory maps of
+    large files (``np.load(..., mmap_mode='r')``) or packed archives. The
+    detections of consecutive chunks are de-duplicated as one sequence, so
+    the dips are identical to those of a single in-memory pass of
+    `dipsearch_arrays` with `method`='vectorized'.
+
+    Parameters
+    ----------
+    t : narray
+        times of the data points
+    flux : narray
+        fluxes of the data points
+    winSize, stepSize, Nneighb, minDur, maxDur, detectionThresh, cadence
+        parameters of the dip search (see `dipsearch`)
+    chunkLength : int
+        number of data points whose windows are searched at a time
+
+    Returns
+    -------
+    t_egress : narray
+        times at the end of the detected dips
+    minFlux : narray
+        minimum fluxes of the dips relative to the local median
+
+    Example
+    -------
+    >>> np.random.seed(99)
+    >>> t, flux = np.arange(1000.), np.random.normal(1.0, 0.001, 1000)
+    >>> flux[[150, 151, 152, 480, 481, 970, 971]] = 0.99
+    >>> t_egress, minFlux = dipsearch_chunked(t, flux, chunkLength=100)
+    >>> t_egress
+    array([153., 482., 972.])
+    >>> all(np.array_equal(a, b) for a, b in zip((t_egress, minFlux),
+    ...     dipsearch_arrays(t, flux, method='vectorized')))
+    True
+    """
+    _checkParameters(winSize, minDur, maxDur)
+
+    # compute min dip duration in days
+    if cadence is None:
+        cadence = (t[-1] - t[0])/len(t)
+    t_minDur = minDur*cadence
+
+    dips = np.array(list(_iterDips(_chunkedDetections(t, flux, winSize,
+        stepSize, Nneighb, minDur, maxDur, detectionThresh, chunkLength),
+        t_minDur)), dtype=float).reshape(-1, 2)
+    return dips[:, 0].copy(), dips[:, 1].copy()
+
+
 def dipsearch(EPICno, photometry, winSize=10, stepSize=1, Nneighb=2, minDur=2, maxDur=5,\
-        detectionThresh=0.995):
+        detectionThresh=0.995, method='loop', baselineCache=None,\
+        cadence=None, screenBin=None, screenThresh=None, baseline='median',\
+        rankError=0.01, workers=1):
     """ Use a sliding window technique to search for dips in photometric time series.
     
     dipsearch iteratively runs through a light curve with a window of N=`winSize`
     data points. The fluxes within the window are compared to a local median, which
     is computed from the neighboring `Nneighb` windows. The data in the current
-    window is ignored for the median computation. 
+    window is ignored for the median computation. The local medians of all
+    window positions are computed incrementally with `rollingMedian` (or, with
+    `method`='vectorized', in blocks with `windowedMedian`). dipsearch collects
+    the dips found by `dipsearch_arrays` in a table.
     
     The window is scanned for `minDur` <= N <= `maxDur` consecutive data points 
     that fall short of a threshold flux of `detectionThresh`*`localMedian`. If
@@ -168,6 +1561,42 @@ def dipsearch(EPICno, photometry, winSize=10, stepSize=1, Nneighb=2, minDur=2, m
         maximum dip duration in # of data points
     detectionThresh : float
         fraction of flux, below which a deviation is registered
+    method : str
+        'loop' calls `findDip` for one window after the other, 'vectorized'
+        computes all thresholds and scans all windows at once as strided views
+        with `findDips`. Both methods give identical results. 'global' scans
+        the whole light curve only once (see Notes).
+    baselineCache : `lcps_cache.BaselineCache`
+        cache that keeps the local medians and MADs for later searches with
+        the same `winSize`, `stepSize` and `Nneighb` (Default: no caching)
+    cadence : float
+        time between two data points. Detections closer than `minDur`
+        cadences to the previous dip are merged with it. (Default: average
+        time between data points of the light curve)
+    screenBin : int
+        bin size of a coarse screen that flags the windows which may contain
+        a dip, so that only these are searched (see `screenWindows`). The
+        flagged windows give the same dips with all methods except 'global',
+        which cannot be screened. (Default: search all windows)
+    screenThresh : float
+        detection threshold of the screen, relative to the estimated local
+        median (Default: halfway between `detectionThresh` and 1)
+    baseline : str
+        'median' compares the fluxes to the median and MAD of the
+        neighborhood. 'mean' and 'clipped-mean' use its mean and standard
+        deviation (without outliers beyond 3 sigma, respectively) instead,
+        which are much faster to compute but less robust against other dips
+        and outliers in the neighborhood (see `windowedMean`). 'sketch'
+        estimates the median and MAD from quantile sketches, which bounds
+        the cost of large neighborhoods (see `sketchedMedian`).
+    rankError : float
+        maximum rank error of the median of `baseline`='sketch' as a
+        fraction of the neighborhood
+    workers : int
+        number of threads that search overlapping segments of the light
+        curve concurrently with `method`='vectorized' and the median
+        baseline. The dips are identical for any number of workers (see
+        Notes).
     
     Returns
     -------
@@ -179,6 +1608,41 @@ def dipsearch(EPICno, photometry, winSize=10, stepSize=1, Nneighb=2, minDur=2, m
             time at end of detected dip 
         minFlux : float
             Minimum flux relative to localMedian
+    
+    Notes
+    -----
+    With a window of `winSize` points sliding by `stepSize`, every data point
+    is examined about `winSize`/`stepSize` times and the same dip is usually
+    detected in many consecutive windows. `method`='global' instead compares
+    each data point to the threshold of the window position centered closest
+    to it and finds all runs of low fluxes in one pass, so that the dip
+    detection costs O(N) regardless of `winSize` and `stepSize`. The local
+    medians are the same as in the windowed search. Its results differ from
+    the windowed methods in the following respects:
+    
+    - The `minDur`/`maxDur` limits apply to the whole run of low fluxes. A
+      window that starts inside a run longer than `maxDur` only sees its tail,
+      so the windowed search reports the egress of such runs, too.
+    - A run is not required to fit into a single window, and runs that end
+      within the last `winSize` points of the light curve are found as well.
+    - `minFlux` is the minimum of the run itself instead of the minimum of
+      the window up to the egress, relative to the local median at the egress.
+    - Near a threshold, single data points may be classified differently,
+      because each point uses one window's threshold instead of the threshold
+      of every window containing it.
+    
+    Dips that are at least one window apart and shorter than `maxDur` are
+    detected with identical egress times by all methods in most cases, and
+    the same de-duplication by `minDur` is applied to all of them.
+    
+    With several `workers`, the window positions are divided into
+    consecutive segments, each of which is searched together with the halo
+    of data points that the neighborhoods of its windows extend to, so
+    every window gets the same local median as in a single pass. The
+    medians and the scans of the windows are computed by numpy routines
+    that release the GIL, so the threads run on several cores. The
+    detections of the segments are de-duplicated in the order of the
+    segments, like those of a single pass.
         
     Example
     -------
@@ -187,40 +1651,531 @@ def dipsearch(EPICno, photometry, winSize=10, stepSize=1, Nneighb=2, minDur=2, m
     >>> photometry = Table([np.arange(1000.), np.random.normal(1.0, 0.005, 1000)],\
         names=['TIME','FLUX'], dtype=[float, float])
     >>> dips = dipsearch(EPICno, photometry)
+    >>> all(dips == dipsearch(EPICno, photometry, method='vectorized'))
+    True
+    >>> all(dips == dipsearch(EPICno, photometry, method='vectorized',
+    ...     workers=4))
+    True
     """            
                    
-    # Check if parameters are consistent
-    if minDur > maxDur:
-        raise ValueError('min dip duration greater than max dip duration')
-    if winSize <= maxDur:
-        raise ValueError('max dip duration greater than or equal window size')
-
     # extract time and flux from `photometry` table
-    t = np.array(photometry['TIME'])
-    flux = np.array(photometry['FLUX'])
+    t = np.asarray(photometry['TIME'])
+    flux = np.asarray(photometry['FLUX'])
+
+    # Slide the window and save any found dips
+    t_egress, minFlux = dipsearch_arrays(t, flux, winSize, stepSize, Nneighb,
+        minDur, maxDur, detectionThresh, method, baselineCache, cadence,
+        screenBin, screenThresh, baseline, rankError, workers)
+    dips = DipBuffer(len(t_egress))
+    dips.extend_target(EPICno, t_egress, minFlux)
+    return dips.to_table()
+
+
+def _stackedMedian(fluxes, winSize, stepSize, Nneighb, chunkSize=2**20):
+    """ Local medians and MADs of several light curves, computed like
+    `windowedMedian` on a zero-padded 2-D array of their fluxes.
+
+    The interior windows of all light curves are computed together by
+    `np.median` over a (targets, windows, neighborhood) array. Returns 2-D
+    arrays of shape (targets, windows of the longest light curve) that are
+    only valid for the window positions of each light curve.
+    """
+    lengths = [len(flux) for flux in fluxes]
+    fluxType = fluxes[0].dtype
+    stacked = np.zeros((len(fluxes), max(lengths)), dtype=fluxType)
+    for k, flux in enumerate(fluxes):
+        stacked[k, :len(flux)] = flux
+    starts = np.arange(0, stacked.shape[1] - winSize, stepSize)
+    localMedian = np.ones((len(fluxes), len(starts)), dtype=fluxType)
+    MAD = np.zeros((len(fluxes), len(starts)), dtype=fluxType)
+
+    # interior windows of each light curve (see `windowedMedian`)
+    interior = [(starts >= max(winSize, Nneighb*winSize)) &
+        (starts + (1 + Nneighb)*winSize <= length) & (Nneighb > 0) for length
+        in lengths]
+    isInterior = np.any(interior, axis=0)
+    iInterior = np.flatnonzero(isInterior)
+    if len(iInterior):
+        Nneighborhood = 2*Nneighb*winSize
+        NwinChunk = max(1, chunkSize//(Nneighborhood*len(fluxes)))
+        rowStride, stride = stacked.strides
+        for j in xrange(iInterior[0], iInterior[-1] + 1, NwinChunk):
+            Nwin = min(NwinChunk, iInterior[-1] + 1 - j)
+            iWinStart = starts[j]
+            left, right = [as_strided(stacked[:, i:], shape=(len(fluxes),
+                Nwin, Nneighb*winSize), strides=(rowStride, stepSize*stride,
+                stride), writeable=False) for i in
+                (iWinStart - Nneighb*winSize, iWinStart + winSize)]
+            neighborhood = np.concatenate([left, right], axis=2)
+            median = np.median(neighborhood, axis=2)
+            localMedian[:, j:j + Nwin] = median
+            MAD[:, j:j + Nwin] = np.median(
+                abs(neighborhood - median[:, :, np.newaxis]), axis=2)
+
+    # windows at the boundaries, stacked by the size of their neighborhoods
+    bySize = {}
+    for k, flux in enumerate(fluxes):
+        Nwin = len(xrange(0, len(flux) - winSize, stepSize))
+        localMedian[k, Nwin:] = 1.
+        MAD[k, Nwin:] = 0.
+        for j in np.flatnonzero(~interior[k][:Nwin]):
+            (iMin, iLeft), (iRight, iMax) = _neighborhood(starts[j], winSize,
+                Nneighb, len(flux))
+            bySize.setdefault(iLeft - iMin + iMax - iRight, []).append(
+                (k, j, k*stacked.shape[1] + iMin, iLeft - iMin,
+                k*stacked.shape[1] + iRight))
+    flat = stacked.ravel()
+    for size, windows in bySize.items():
+        k, j, first, Nleft, firstRight = np.array(windows).T
+        if not size:
+            localMedian[k, j] = MAD[k, j] = np.nan
+            continue
+        i = np.arange(size)
+        index = np.where(i < Nleft[:, np.newaxis], first[:, np.newaxis] + i,
+            firstRight[:, np.newaxis] + i - Nleft[:, np.newaxis])
+        neighborhood = flat[index]
+        median = np.median(neighborhood, axis=1)
+        localMedian[k, j] = median
+        MAD[k, j] = np.median(abs(neighborhood - median[:, np.newaxis]),
+            axis=1)
+    return localMedian, MAD
+
+
+def _stackedDetections(times, fluxes, winSize, stepSize, minDur, maxDur,
+        localMedian, MAD, detectionThresh, chunkSize=2**20):
+    """ Yield (index of light curve, t_egress, minFlux) of the dips that
+    `_vectorizedDetections` finds in each of several light curves of the same
+    precision, with the local medians and MADs of `_stackedMedian`. Blocks of
+    windows of many light curves are searched by `findDips` at once; the
+    windows beyond the end of each light curve get a threshold of -inf.
+    """
+    Ntargets, NwinMax = localMedian.shape
+    stacked = []
+    for arrays in (times, fluxes):
+        padded = np.zeros((Ntargets, max(len(a) for a in arrays)),
+            dtype=np.result_type(*arrays))
+        for k, a in enumerate(arrays):
+            padded[k, :len(a)] = a
+        rowStride, stride = padded.strides
+        stacked.append(as_strided(padded, shape=(Ntargets, NwinMax, winSize),
+            strides=(rowStride, stepSize*stride, stride), writeable=False))
+    timeWindows, fluxWindows = stacked
+
+    fluxThresh = _fluxThresholds(localMedian, MAD, detectionThresh,
+        fluxWindows.dtype)
+    for k, flux in enumerate(fluxes):
+        fluxThresh[k, len(xrange(0, len(flux) - winSize, stepSize)):] = -np.inf
+
+    # blocks of whole light curves, or of windows of a single light curve
+    NwinChunk = max(1, min(NwinMax, chunkSize//winSize))
+    NtargetChunk = max(1, chunkSize//(NwinMax*winSize)) if NwinMax else 1
+    for k in xrange(0, Ntargets, NtargetChunk):
+        targets = slice(k, k + NtargetChunk)
+        for j in xrange(0, NwinMax, NwinChunk):
+            windows = slice(j, j + NwinChunk)
+            blockShape = fluxThresh[targets, windows].shape
+            detected, t_egress, minFlux = findDips(
+                timeWindows[targets, windows].reshape(-1, winSize),
+                fluxWindows[targets, windows].reshape(-1, winSize),
+                minDur, maxDur, localMedian[targets, windows].ravel(),
+                fluxThresh[targets, windows].ravel())
+            for i in np.flatnonzero(detected):
+                yield k + i//blockShape[1], t_egress[i], minFlux[i]
+
+
+def dipsearch_many(lightcurves, winSize=10, stepSize=1, Nneighb=2, minDur=2,
+        maxDur=5, detectionThresh=0.995, maxPadding=0.1, chunkSize=2**20):
+    """ Search many light curves for dips at once.
+
+    dipsearch_many gives the same dips as `dipsearch` for each light curve,
+    but processes groups of light curves together. Light curves with the same
+    precision whose lengths differ by at most a fraction `maxPadding` are
+    zero-padded to a 2-D (targets x cadences) array. The local medians of
+    the windows that all of them share are computed with a single
+    `np.median` call, and the windows of all light curves of a group are
+    searched for dips in blocks of `findDips` calls. Windows beyond the end
+    of a light curve are masked out. This saves the per-target overhead of
+    `dipsearch` for campaigns of many short light curves.
+
+    Parameters
+    ----------
+    lightcurves : list
+        (EPICno, photometry) of the light curves, with photometry tables as in
+        `dipsearch`
+    winSize, stepSize, Nneighb, minDur, maxDur, detectionThresh
+        parameters of the dip search (see `dipsearch`)
+    maxPadding : float
+        maximum relative difference of the lengths of light curves that are
+        processed together
+    chunkSize : int
+        Maximum number of data points per block of windows or neighborhoods
+
+    Returns
+    -------
+    dips : list
+        one table of dips for each light curve, as returned by `dipsearch`
+
+    Example
+    -------
+    >>> np.random.seed(99)
+    >>> lightcurves = [(EPICno, Table([np.arange(1000. + EPICno),
+    ...     np.random.normal(1.0, 0.005, 1000 + EPICno)], names=['TIME','FLUX']))
+    ...     for EPICno in range(5)]
+    >>> all([all(dips == dipsearch(EPICno, photometry)) for dips,
+    ...     (EPICno, photometry) in zip(dipsearch_many(lightcurves),
+    ...     lightcurves)])
+    True
+    """
+    _checkParameters(winSize, minDur, maxDur)
+    times, fluxes = [], []
+    for EPICno, photometry in lightcurves:
+        times.append(np.asarray(photometry['TIME']))
+        flux = np.asarray(photometry['FLUX'])
+        if not np.issubdtype(flux.dtype, np.floating):
+            flux = flux.astype(float)
+        fluxes.append(flux)
+
+    # group light curves of the same precision and similar length
+    order = sorted(xrange(len(fluxes)), key=lambda k: (fluxes[k].dtype.str,
+        times[k].dtype.str, len(fluxes[k])))
+    groups = []
+    for k in order:
+        group = groups[-1] if groups else None
+        if group and fluxes[k].dtype == fluxes[group[0]].dtype and \
+                times[k].dtype == times[group[0]].dtype and \
+                len(fluxes[k]) <= (1. + maxPadding)*len(fluxes[group[0]]):
+            group.append(k)
+        else:
+            groups.append([k])
+
+    dips = [DipBuffer() for lightcurve in lightcurves]
+    for group in groups:
+        groupFluxes = [fluxes[k] for k in group]
+        localMedian, MAD = _stackedMedian(groupFluxes, winSize, stepSize,
+            Nneighb, chunkSize)
+        prev_t_egress = [0.]*len(group)
+        for i, t_egress, minFlux in _stackedDetections([times[k] for k in
+                group], groupFluxes, winSize, stepSize, minDur, maxDur,
+                localMedian, MAD, detectionThresh, chunkSize):
+            k = group[i]
+            t = times[k]
+            t_minDur = minDur*((t[-1] - t[0])/len(t))
+            # check if detected dip is a new one
+            if t_egress and (t_egress - prev_t_egress[i]) > t_minDur:
+                dips[k].append(lightcurves[k][0], t_egress, minFlux)
+                prev_t_egress[i] = t_egress
+    return [buffer.to_table() for buffer in dips]
+
+
+class DipDetector(object):
+    """ Incremental dip search for light curves that grow with time.
     
-    # compute min dip duration in days
-    cadence = (t[-1] - t[0])/len(t)
-    t_minDur = minDur*cadence
+    DipDetector accepts a light curve in consecutive blocks of data points
+    and finds the same dips as `dipsearch` with the whole light curve. The
+    local median of a window is final as soon as the data of its whole
+    neighborhood have arrived, so each call of `update` only searches the
+    windows that became final since the previous call and returns the newly
+    found dips. Only the data that later windows and their neighborhoods
+    need are kept. `finish` searches the windows at the end of the light
+    curve, whose neighborhoods are truncated.
+    
+    The de-duplication of detections by `dipsearch` depends on the cadence
+    of the light curve. If `cadence` is given, dips are returned as soon as
+    they are found and agree with ``dipsearch(..., cadence=cadence)``.
+    Otherwise, the cadence is estimated from the whole light curve like in
+    `dipsearch`, and all dips are returned by `finish`.
+    
+    Parameters
+    ----------
+    EPICno : str
+        EPIC number of the target
+    winSize, stepSize, Nneighb, minDur, maxDur, detectionThresh
+        parameters of the dip search (see `dipsearch`)
+    cadence : float
+        time between two data points (see `dipsearch`)
+    
+    Example
+    -------
+    >>> np.random.seed(99)
+    >>> t = np.arange(1000.)
+    >>> flux = np.random.normal(1.0, 0.001, 1000)
+    >>> flux[[150, 151, 152, 480, 481, 970, 971]] = 0.99
+    >>> detector = DipDetector('9999999', cadence=1.)
+    >>> dips = [detector.update(t[i:i + 100], flux[i:i + 100])
+    ...     for i in range(0, 1000, 100)] + [detector.finish()]
+    >>> [len(d) for d in dips]
+    [0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0]
+    >>> batch = dipsearch('9999999', Table([t, flux], names=['TIME','FLUX']),
+    ...     cadence=1.)
+    >>> list(np.concatenate([d['t_egress'] for d in dips])) == list(batch['t_egress'])
+    True
+    """
+    def __init__(self, EPICno, winSize=10, stepSize=1, Nneighb=2, minDur=2,
+            maxDur=5, detectionThresh=0.995, cadence=None):
+        _checkParameters(winSize, minDur, maxDur)
+        self.EPICno = EPICno
+        self.winSize = winSize
+        self.stepSize = stepSize
+        self.Nneighb = Nneighb
+        self.minDur = minDur
+        self.maxDur = maxDur
+        self.detectionThresh = detectionThresh
+        self.cadence = cadence
+        
+        # data points from index `_offset` on, and number of all data points
+        self._time = None
+        self._flux = None
+        self._offset = 0
+        self._N = 0
+        self._t_first = None
+        
+        # index of the next window to search, detections that wait for the
+        # cadence and the egress time of the last dip
+        self._jNext = 0
+        self._detections = []
+        self._prev_t_egress = 0.
+        self._finished = False
+        
+    def update(self, time, flux):
+        """ Add a block of data points and return the dips that are found in
+        the windows that became final.
+        
+        Parameters
+        ----------
+        time : narray
+            times of the new data points
+        flux : narray
+            fluxes of the new data points (converted to the precision of the
+            first block)
+        
+        Returns
+        -------
+        dips : Astropy table
+            new dips, see `dipsearch`
+        """
+        if self._finished:
+            raise ValueError('cannot update a finished DipDetector')
+        time = np.asarray(time)
+        flux = np.asarray(flux)
+        if self._flux is None:
+            if not np.issubdtype(flux.dtype, np.floating):
+                flux = flux.astype(float)
+            self._time, self._flux = time[:0], flux[:0]
+        if self._t_first is None and len(time):
+            self._t_first = time[0]
+        self._time = np.concatenate([self._time, time])
+        self._flux = np.concatenate([self._flux,
+            flux.astype(self._flux.dtype, copy=False)])
+        self._N += len(flux)
+        
+        # windows whose neighborhoods are complete, up to the first one that
+        # is not (windows at the beginning have twice as many neighbors)
+        w, N = self.winSize, self.Nneighb
+        starts = np.arange(self._jNext*self.stepSize, self._N - w,
+            self.stepSize)
+        final = starts <= np.where(starts < w, self._N - (1 + 2*N)*w,
+            self._N - (1 + N)*w)
+        Nfinal = len(final) if final.all() else final.argmin()
+        dips = self._search(starts[:Nfinal]).to_table()
+        
+        # drop data that no later window or neighborhood needs
+        keep = max(0, self._jNext*self.stepSize - 2*N*w) - self._offset
+        if keep > 0:
+            self._time = self._time[keep:]
+            self._flux = self._flux[keep:]
+            self._offset += keep
+        return dips
+        
+    def finish(self):
+        """ Search the remaining windows at the end of the light curve and
+        return their dips (and all dips if no `cadence` is given)."""
+        if self._finished:
+            raise ValueError('DipDetector is already finished')
+        self._finished = True
+        if not self._N:
+            return DipBuffer().to_table()
+        starts = np.arange(self._jNext*self.stepSize, self._N - self.winSize,
+            self.stepSize)
+        dips = self._search(starts)
+        if self.cadence is None:
+            t_minDur = self.minDur*((self._time[-1] - self._t_first)/self._N)
+            self._dedupe(self._detections, t_minDur, dips)
+        return dips.to_table()
+    
+    def _search(self, starts):
+        """ Search the windows beginning at the global indices `starts` and
+        return the new dips in a `DipBuffer`."""
+        dips = DipBuffer()
+        if not len(starts):
+            return dips
+        off = self._offset
+        localMedians, localMADs = _blockMedian(self._flux, starts,
+            self.winSize, self.stepSize, self.Nneighb, self._N, off)
+        detections = list(_vectorizedDetections(self._time[starts[0] - off:],
+            self._flux[starts[0] - off:], self.winSize, self.stepSize,
+            self.minDur, self.maxDur, localMedians, localMADs,
+            self.detectionThresh))
+        self._jNext += len(starts)
+        if self.cadence is None:
+            self._detections.extend(detections)
+        else:
+            self._dedupe(detections, self.minDur*self.cadence, dips)
+        return dips
+    
+    def _dedupe(self, detections, t_minDur, dips):
+        """ Add the detections that are new dips to `dips`, like
+        `dipsearch`."""
+        for t_egress, minFlux in detections:
+            if t_egress:
+                # check if detected dip is a new one
+                if (t_egress - self._prev_t_egress) > t_minDur:
+                    dips.append(self.EPICno, t_egress, minFlux)
+                    self._prev_t_egress = t_egress
 
-    # prepare results
-    dips = Table(names=['EPIC','t_egress','minFlux'], dtype=['i8',float,float])    
+
+def grid(**parameters):
+    """ List all combinations of parameter values of `dipsearch`.
     
-    # Slide the window  
-    prev_t_egress = 0.
-    for i in xrange(0, len(flux) - winSize, stepSize):
-        timeWindow = t[i:i + winSize]
-        fluxWindow = flux[i:i + winSize]
-        localMedian, localMAD = get_localMedian(flux, i, winSize, Nneighb)
-        t_egress, minFlux = findDip(timeWindow, fluxWindow, minDur, maxDur,\
-            localMedian, localMAD, detectionThresh)
-        if t_egress:
-            # check if detected dip is a new one
-            if (t_egress - prev_t_egress) > t_minDur:
-                # save any found dips
-                dips.add_row([EPICno, t_egress, minFlux])
-                prev_t_egress = t_egress
-    return dips
+    Combinations with inconsistent dip durations (see `dipsearch`) are left
+    out. Parameters that are not given keep the default of `dipsearch`.
+    
+    Example
+    -------
+    >>> len(grid(winSize=[10, 20], minDur=[2, 3], detectionThresh=[0.99, 0.98]))
+    8
+    >>> [sorted(configuration.items()) for configuration in
+    ...     grid(winSize=[5, 10], maxDur=[5])]
+    [[('maxDur', 5), ('winSize', 10)]]
+    """
+    names = sorted(parameters)
+    configurations = []
+    for values in itertools.product(*[parameters[name] for name in names]):
+        configuration = dict(zip(names, values))
+        winSize, stepSize, Nneighb, minDur, maxDur, detectionThresh = \
+            _sweepParameters(configuration)
+        try:
+            _checkParameters(winSize, minDur, maxDur)
+        except ValueError:
+            continue
+        configurations.append(configuration)
+    return configurations
+
+
+def _sweepParameters(configuration):
+    """ Parameters (winSize, stepSize, Nneighb, minDur, maxDur,
+    detectionThresh) of a configuration, with the defaults of `dipsearch`."""
+    names = ('winSize', 'stepSize', 'Nneighb', 'minDur', 'maxDur',
+        'detectionThresh')
+    unknown = set(configuration) - set(names)
+    if unknown:
+        raise ValueError('unknown parameters {}'.format(sorted(unknown)))
+    # defaults by argument name, the trailing arguments of `dipsearch`
+    argspec = inspect.getargspec(dipsearch)
+    defaults = dict(zip(argspec.args[-len(argspec.defaults):],
+        argspec.defaults))
+    defaults.update(configuration)
+    return tuple(defaults[name] for name in names)
+
+
+def dipsweep(EPICno, photometry, configurations, baselineCache=None):
+    """ Search a light curve for dips with many parameter configurations.
+
+    dipsweep gives the same dips as `dipsearch` with each configuration, but
+    computes the local medians only once for all configurations with the same
+    `winSize`, `stepSize` and `Nneighb`. All thresholds and duration limits
+    are evaluated against these medians, and each threshold only searches
+    the windows that contain fluxes below it (see `_sweepDetections`).
+
+    Parameters
+    ----------
+    EPICno : str
+        EPIC number of the target
+    photometry : Astropy Table
+        A table with the whole photometric data containing columns 'TIME', 'FLUX'
+    configurations : list
+        dicts of parameters of `dipsearch` (winSize, stepSize, Nneighb, minDur,
+        maxDur, detectionThresh), e.g. from `grid`. Parameters that are not
+        given keep the default of `dipsearch`.
+    baselineCache : `lcps_cache.BaselineCache`
+        cache that keeps the local medians and MADs for later searches
+        (Default: no caching)
+
+    Returns
+    -------
+    dips : Astropy table
+        A table containing parameters of detected dips, sorted by
+        configuration. Columns:
+        config : int
+            index of the configuration in `configurations`
+        EPIC : str
+            EPIC number of the target
+        t_egress : float
+            time at end of detected dip
+        minFlux : float
+            Minimum flux relative to localMedian
+
+    Example
+    -------
+    >>> np.random.seed(99)
+    >>> photometry = Table([np.arange(1000.), np.random.normal(1.0, 0.005, 1000)],\
+        names=['TIME','FLUX'], dtype=[float, float])
+    >>> configurations = grid(detectionThresh=[0.99, 0.995], maxDur=[3, 5])
+    >>> dips = dipsweep('9999999', photometry, configurations)
+    >>> all(all(dips[dips['config'] == i]['t_egress'] == dipsearch('9999999',
+    ...     photometry, **configuration)['t_egress'])
+    ...     for i, configuration in enumerate(configurations))
+    True
+    """
+    parameters = [_sweepParameters(configuration) for configuration in
+        configurations]
+    for winSize, stepSize, Nneighb, minDur, maxDur, detectionThresh in \
+            parameters:
+        _checkParameters(winSize, minDur, maxDur)
+
+    # extract time and flux from `photometry` table
+    t = np.asarray(photometry['TIME'])
+    flux = np.asarray(photometry['FLUX'])
+
+    # group configurations by their local medians
+    groups = {}
+    for iConfig, params in enumerate(parameters):
+        groups.setdefault(params[:3], []).append(iConfig)
+
+    cadence = (t[-1] - t[0])/len(t)
+    dips = [DipBuffer() for configuration in configurations]
+    for (winSize, stepSize, Nneighb), iConfigs in sorted(groups.items()):
+        if baselineCache is not None:
+            localMedians, localMADs = baselineCache.load(flux, winSize,
+                stepSize, Nneighb, windowedMedian)
+        else:
+            localMedians, localMADs = windowedMedian(flux, winSize, stepSize,
+                Nneighb)
+        thresholds = sorted(set(parameters[i][5] for i in iConfigs))
+        durations = sorted(set(parameters[i][3:5] for i in iConfigs))
+        configIndex = {}
+        for i in iConfigs:
+            configIndex.setdefault((thresholds.index(parameters[i][5]),
+                durations.index(parameters[i][3:5])), []).append(i)
+
+        # de-duplicate the detections of each configuration like `dipsearch`
+        prev_t_egress = dict((i, 0.) for i in iConfigs)
+        for iThresh, iDur, t_egress, minFlux in _sweepDetections(t, flux,
+                winSize, stepSize, localMedians, localMADs, thresholds,
+                durations):
+            if not t_egress:
+                continue
+            for iConfig in configIndex.get((iThresh, iDur), ()):
+                if (t_egress - prev_t_egress[iConfig]) > \
+                        durations[iDur][0]*cadence:
+                    dips[iConfig].append(EPICno, t_egress, minFlux)
+                    prev_t_egress[iConfig] = t_egress
+
+    config = np.repeat(np.arange(len(dips)), [len(d) for d in dips])
+    columns = [np.concatenate([d[name] for d in dips] +
+        [np.empty(0, dtype=dtype)]) for name, dtype in
+        zip(DipBuffer.names, DipBuffer.dtypes)]
+    return Table([config] + columns, names=('config',) + DipBuffer.names,
+        dtype=('i8',) + DipBuffer.dtypes)
   
 if __name__ == "__main__":
     import doctest